@@ -0,0 +1,382 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mysql.connector
+import requests
+
+from rules import RuleSet
+
+# =============================================================================
+# LUNCH-RUSH LOAD BENCHMARK
+# =============================================================================
+# Seeds a throwaway MySQL database with a synthetic roster and claim history,
+# stands in for the Node.js printer server, runs the backend in-process under
+# waitress and replays scanner traffic against POST /verificar:
+#
+#   python benchmark.py --students 2000 --scans 3000 --save-baseline
+#   python benchmark.py --students 2000 --scans 3000       # fails on regression
+#
+# Needs a local MySQL (the credentials in server.db_config, or --db-*); the
+# benchmark database is dropped and re-created on every run.
+
+GRADES = ["K2", "K5", "1", "2", "3", "5", "7", "9", "10", "11"]
+FOOD_TYPES = ["REFRIGERIO", "ALMUERZO", "REFRIGERIO Y ALMUERZO", "REFRIGERIO Y ALMUERZO", "NINGUNO"]
+SEED_CHUNK = 1000
+
+# Metrics compared against the baseline: name -> True if higher is better
+COMPARED = {
+    "throughput_rps": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "durable_p99_ms": False,
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# =============================================================================
+# SEEDING
+# =============================================================================
+
+def seed_database(args, rng):
+    """Create the benchmark database and fill roster and claim history"""
+    conn = mysql.connector.connect(
+        host=args.db_host, port=args.db_port, user=args.db_user, password=args.db_password, charset='utf8mb4'
+    )
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{args.db_name}`")
+    cursor.execute(f"CREATE DATABASE `{args.db_name}` CHARACTER SET utf8mb4")
+    cursor.execute(f"USE `{args.db_name}`")
+
+    import migrations
+    migrations.upgrade(conn)
+
+    students = [
+        (f"{100000 + index}", f"Student {index}", rng.choice(GRADES), rng.choice(FOOD_TYPES))
+        for index in range(args.students)
+    ]
+    for start in range(0, len(students), SEED_CHUNK):
+        cursor.executemany(
+            "INSERT INTO estudiantes (codigo_estudiante, nombre, grado, tipo_alimentacion) VALUES (%s, %s, %s, %s)",
+            students[start:start + SEED_CHUNK]
+        )
+    conn.commit()
+
+    # Claim history: past days plus part of today so duplicate paths are hit
+    records = []
+    for days_ago in range(args.history_days, -1, -1):
+        day = date.today() - timedelta(days=days_ago)
+        rate = args.claimed_today if days_ago == 0 else args.history_rate
+        for plan, hour in (("SNACK", 9), ("LUNCH", 12)):
+            for code, nombre, _, food in students:
+                if rng.random() < rate:
+                    records.append((code, nombre, food, datetime.combine(day, datetime.min.time()).replace(hour=hour), plan))
+
+    for start in range(0, len(records), SEED_CHUNK):
+        chunk = records[start:start + SEED_CHUNK]
+        cursor.executemany("""
+            INSERT INTO registros_validacion (codigo_estudiante, nombre, tipo_alimentacion, fecha_hora, plan, estado)
+            VALUES (%s, %s, %s, %s, %s, 'VALIDADO')
+        """, chunk)
+        cursor.executemany("""
+            INSERT IGNORE INTO reclamos_diarios (codigo_estudiante, fecha, plan, fecha_hora)
+            VALUES (%s, %s, %s, %s)
+        """, [(code, fecha_hora.date(), plan, fecha_hora) for code, _, _, fecha_hora, plan in chunk])
+        conn.commit()
+
+    cursor.close()
+    conn.close()
+    print(f"🌱 Seeded {len(students)} students and {len(records)} historical claims")
+    return [code for code, _, _, _ in students]
+
+
+# =============================================================================
+# PRINTER STAND-IN
+# =============================================================================
+
+def start_printer_stub(latency):
+    """HTTP stand-in for the Node.js printer server (POST /imprimir)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if latency:
+                time.sleep(latency)
+            body = b'{"success": true, "message": "Printing..."}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    stub.daemon_threads = True
+    threading.Thread(target=stub.serve_forever, name="printer-stub", daemon=True).start()
+    return stub
+
+
+# =============================================================================
+# TRAFFIC
+# =============================================================================
+
+def build_scans(codes, args, rng):
+    """Scanner traffic: shuffled roster with repeat scans and invalid codes"""
+    queue = list(codes)
+    rng.shuffle(queue)
+    recent = []
+    scans = []
+    for _ in range(args.scans):
+        roll = rng.random()
+        if roll < args.invalid_rate:
+            scans.append(f"X{rng.randrange(10**6):06d}")
+        elif roll < args.invalid_rate + args.repeat_rate and recent:
+            # Scanner double-read or student scanning again
+            scans.append(rng.choice(recent[-20:]))
+        else:
+            code = queue.pop() if queue else rng.choice(codes)
+            recent.append(code)
+            scans.append(code)
+    return scans
+
+
+def run_phase(server, base_url, service, scans, args):
+    """Replay scans in bursts for one service window; returns per-scan results"""
+    # Keep this service open all day, whatever the time of the run
+    base = server.service_rules.rules
+    server.service_rules.rules = RuleSet({
+        "services": {
+            service: {"start": "00:00", "end": "24:00", "plan_keywords": list(base.plan_keywords[service])}
+        },
+        "blocked_grades": sorted(base.blocked_grades)
+    })
+
+    results = []
+    results_lock = threading.Lock()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+
+    def scan(code):
+        start = time.perf_counter()
+        response = session.post(f"{base_url}/verificar", json={"codigo": code}, timeout=30)
+        elapsed = time.perf_counter() - start
+        with results_lock:
+            results.append((code, response.status_code, elapsed, time.monotonic()))
+
+    lag_samples = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for start in range(0, len(scans), args.burst_size):
+            list(pool.map(scan, scans[start:start + args.burst_size]))
+            lanes = session.get(f"{base_url}/lanes", timeout=10).json()
+            lag_samples.append(max(lanes["print"]["oldest_age_seconds"], lanes["persistence"]["oldest_age_seconds"]))
+            if args.burst_pause:
+                time.sleep(args.burst_pause)
+
+    return results, lag_samples
+
+
+# (codigo, plan) -> monotonic time the claim's group commit finished
+durable_at = {}
+
+
+def track_durability(server):
+    """Record when each claim's group commit finished"""
+    original = server.claim_writer._on_persisted
+
+    def on_persisted(records):
+        now = time.monotonic()
+        for record in records:
+            durable_at[(record['codigo_estudiante'], record['plan'])] = now
+        original(records)
+
+    server.claim_writer._on_persisted = on_persisted
+
+
+def wait_until_durable(server, expected, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.claim_writer.stats()["unacknowledged"] == 0 and len(durable_at) >= expected:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+# =============================================================================
+# REPORT / BASELINE
+# =============================================================================
+
+def claimed_scans(all_results):
+    """(codigo, service) -> when its claim was first answered"""
+    # Repeat scans replay the first scan's 200 (scan cache / coalescing):
+    # only the first 200 per student and service is a claim
+    claimed = {}
+    for service, code, status, _, answered_at in all_results:
+        key = (code, service)
+        if status == 200 and answered_at < claimed.get(key, float("inf")):
+            claimed[key] = answered_at
+    return claimed
+
+
+def summarize(all_results, lag_samples, elapsed):
+    latencies = [elapsed_s for _, _, _, elapsed_s, _ in all_results]
+    durable = [
+        durable_at[key] - answered_at
+        for key, answered_at in claimed_scans(all_results).items()
+        if key in durable_at
+    ]
+    statuses = {}
+    for _, _, status, _, _ in all_results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        "scans": len(all_results),
+        "statuses": statuses,
+        "throughput_rps": round(len(all_results) / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queue_lag_max_ms": round(max(lag_samples, default=0.0) * 1000, 2),
+        "durable_p50_ms": round(percentile(durable, 0.50) * 1000, 2),
+        "durable_p99_ms": round(percentile(durable, 0.99) * 1000, 2),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Regressions beyond the tolerance, as readable lines"""
+    failures = []
+    for name, higher_is_better in COMPARED.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        current, reference = report[name], baseline[name]
+        change = (current - reference) / reference
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        if regressed:
+            failures.append(f"{name}: {current} vs baseline {reference} ({change:+.0%})")
+    return failures
+
+
+def parse_args():
+    import server
+    db = server.db_config
+
+    parser = argparse.ArgumentParser(description="Lunch-rush load benchmark for POST /verificar")
+    parser.add_argument("--students", type=int, default=1500)
+    parser.add_argument("--history-days", type=int, default=120, help="days of past claims to seed")
+    parser.add_argument("--history-rate", type=float, default=0.7, help="share of students claiming per past service")
+    parser.add_argument("--claimed-today", type=float, default=0.1, help="share already claimed today")
+    parser.add_argument("--scans", type=int, default=2000, help="scans per service window")
+    parser.add_argument("--services", default="SNACK,LUNCH")
+    parser.add_argument("--burst-size", type=int, default=40)
+    parser.add_argument("--burst-pause", type=float, default=0.0, help="seconds between bursts")
+    parser.add_argument("--concurrency", type=int, default=8, help="scanners firing at once")
+    parser.add_argument("--repeat-rate", type=float, default=0.1)
+    parser.add_argument("--invalid-rate", type=float, default=0.03)
+    parser.add_argument("--printer-latency", type=float, default=0.02, help="printer stub delay (seconds)")
+    parser.add_argument("--threads", type=int, default=8, help="server request threads")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-host", default=db['host'])
+    parser.add_argument("--db-port", type=int, default=db['port'])
+    parser.add_argument("--db-user", default=db['user'])
+    parser.add_argument("--db-password", default=db['password'])
+    parser.add_argument("--db-name", default="cafeteria_bench")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    return parser.parse_args()
+
+
+def main():
+    # Local state goes to a scratch directory, never the real journal
+    os.environ["CAFETERIA_RUNTIME_DIR"] = tempfile.mkdtemp(prefix="cafeteria-bench-")
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    import server
+    from waitress import create_server
+
+    codes = seed_database(args, rng)
+
+    server.db_config.update({
+        'host': args.db_host, 'port': args.db_port, 'user': args.db_user,
+        'password': args.db_password, 'database': args.db_name
+    })
+    server.DB_POOL_SIZE = min(max(args.threads, 4), 32)
+
+    stub = start_printer_stub(args.printer_latency)
+    server.PRINTER_SERVER_URL = f"http://127.0.0.1:{stub.server_port}/imprimir"
+    server.printer_pool = None
+
+    track_durability(server)
+    server.warm_up()
+    server.start_background_services()
+
+    httpd = create_server(server.app, host="127.0.0.1", port=0, threads=args.threads)
+    threading.Thread(target=httpd.run, name="bench-server", daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.effective_port}"
+
+    all_results = []
+    lag_samples = []
+    started = time.perf_counter()
+    for service in [s.strip().upper() for s in args.services.split(",") if s.strip()]:
+        scans = build_scans(codes, args, rng)
+        print(f"🏃 {service}: replaying {len(scans)} scans in bursts of {args.burst_size}")
+        results, lags = run_phase(server, base_url, service, scans, args)
+        all_results.extend((service, code, status, elapsed, answered_at) for code, status, elapsed, answered_at in results)
+        lag_samples.extend(lags)
+    elapsed = time.perf_counter() - started
+
+    expected = len(claimed_scans(all_results))
+    if not wait_until_durable(server, expected):
+        print("❌ Not every claim became durable within 60s")
+
+    report = summarize(all_results, lag_samples, elapsed)
+    report.update({"students": args.students, "history_days": args.history_days, "threads": args.threads})
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️  No baseline yet, run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    failures = compare(report, baseline, args.tolerance)
+    if failures:
+        print("\n" + "!"*60)
+        print("❌ PERFORMANCE REGRESSION")
+        for failure in failures:
+            print(f"   {failure}")
+        print("!"*60)
+        return 1
+
+    print(f"✅ Within {args.tolerance:.0%} of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
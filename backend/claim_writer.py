@@ -0,0 +1,348 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+from mysql.connector import errors
+
+from lanes import LaneFull
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# WRITE-BEHIND FOR CLAIM RECORDS
+# =============================================================================
+# Claims are appended to an fsync'd journal before the scan is answered, then
+# flushed to MySQL in batches (one multi-row INSERT + one COMMIT per batch).
+# Batches that reached the database are acknowledged in the journal; anything
+# not acknowledged is replayed when the server starts again.
+#
+# Each process writes its own journal (claims.journal, claims.1.journal, ...),
+# held with an exclusive lock for as long as it runs. At startup a process
+# also adopts the journals no running process holds, so claims spooled by a
+# process that is not coming back are replayed too.
+
+MAX_RETRY_DELAY = 10.0
+MAX_JOURNALS = 32
+
+# Errors that will not go away by retrying the same rows
+PERMANENT_ERRORS = (errors.IntegrityError, errors.DataError, errors.ProgrammingError)
+
+
+class ClaimWriteBehind:
+    """Batches claim records into group commits behind a local journal"""
+
+    def __init__(self, get_connection, save_records, journal_path,
+                 batch_size=50, max_delay=0.25, retry_delay=2.0,
+                 workers=1, max_pending=2000, spooling=None,
+                 on_persisted=None, on_failed=None):
+        self._get_connection = get_connection
+        self._save_records = save_records
+        self._base_journal_path = journal_path
+        self._journal_path = journal_path
+        self._journal_lock_file = None
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self._retry_delay = retry_delay
+        self._workers = workers
+        self._max_pending = max_pending
+        self._spooling = spooling     # () -> True while the database is down
+        self._on_persisted = on_persisted
+        self._on_failed = on_failed
+
+        self._pending = deque()
+        self._unacked = set()
+        self._ready = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._threads = []
+
+    # -------------------------------------------------------------------------
+    # Request path
+    # -------------------------------------------------------------------------
+    def submit(self, record):
+        """Journal the claim (durable on return) and queue it for the next batch"""
+        self.submit_many([record])
+
+    def submit_many(self, records):
+        """Journal several claims with a single fsync and queue them together"""
+        # The cap is backpressure for a slow database; while it is down the
+        # journal is the spool, so keep taking claims
+        if len(self._pending) + len(records) > self._max_pending and not (self._spooling and self._spooling()):
+            raise LaneFull(f"persistence lane is full ({self._max_pending} claims)")
+
+        with self._journal_lock:
+            self._write_journal([{"op": "claim", "record": _encode(record)} for record in records])
+            self._unacked.update(record['claim_uid'] for record in records)
+
+        with self._ready:
+            was_empty = not self._pending
+            now = time.monotonic()
+            self._pending.extend((now, record) for record in records)
+            # Wake the flusher to start the delay timer or to flush a full batch
+            if was_empty or len(self._pending) >= self._batch_size:
+                self._ready.notify()
+
+    def stats(self):
+        with self._ready:
+            depth = len(self._pending)
+            oldest = self._pending[0][0] if self._pending else None
+        return {
+            "workers": self._workers,
+            "depth": depth,
+            "capacity": self._max_pending,
+            "saturated": depth >= self._max_pending * 0.8,
+            "oldest_age_seconds": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+            "unacknowledged": len(self._unacked),
+            "journal": self._journal_path
+        }
+
+    @property
+    def saturated(self):
+        return len(self._pending) >= self._max_pending * 0.8
+
+    # -------------------------------------------------------------------------
+    # Startup
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Replay unacknowledged claims from the journal and start flushing"""
+        if self._threads:
+            return
+
+        folder = os.path.dirname(self._journal_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self._journal_path, self._journal_lock_file = self._lock_free_journal()
+        _trim_torn_write(self._journal_path)
+        replayed = _read_journal(self._journal_path)
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+        adopted = self._adopt_orphaned_journals({record['claim_uid'] for record in replayed})
+        replayed.extend(adopted)
+
+        now = time.monotonic()
+        for record in replayed:
+            self._unacked.add(record['claim_uid'])
+            self._pending.append((now, record))
+        if replayed:
+            logger.info(f"♻️ Replaying {len(replayed)} journaled claims ({len(adopted)} from other journals)")
+
+        # Several flushers overlap one batch's round-trip with the next batch
+        for index in range(self._workers):
+            thread = threading.Thread(target=self._run, name=f"claim-writer-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _journal_paths(self):
+        root, ext = os.path.splitext(self._base_journal_path)
+        yield self._base_journal_path
+        for index in range(1, MAX_JOURNALS):
+            yield f"{root}.{index}{ext}"
+
+    def _lock_free_journal(self):
+        """First journal no other process holds, as (path, open lock file)"""
+        for path in self._journal_paths():
+            lock_file = _try_lock(path + ".lock")
+            if lock_file:
+                return path, lock_file
+        raise RuntimeError(f"All {MAX_JOURNALS} claim journals are in use by other processes")
+
+    def _adopt_orphaned_journals(self, known):
+        """Move claims from journals no running process holds into this one"""
+        adopted = []
+        for path in self._journal_paths():
+            if path == self._journal_path or not os.path.exists(path):
+                continue
+            lock_file = _try_lock(path + ".lock")
+            if not lock_file:
+                continue        # Another process is running with it
+            try:
+                records = [r for r in _read_journal(path) if r['claim_uid'] not in known]
+                if records:
+                    # Durable here before the other file goes away
+                    with self._journal_lock:
+                        self._write_journal([{"op": "claim", "record": _encode(r)} for r in records])
+                    known.update(record['claim_uid'] for record in records)
+                    adopted.extend(records)
+                os.remove(path)
+            finally:
+                lock_file.close()
+        return adopted
+
+    # -------------------------------------------------------------------------
+    # Flushing
+    # -------------------------------------------------------------------------
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            delay = self._retry_delay
+            while not self._flush(batch):
+                # Database down: claims stay spooled in the journal meanwhile
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _next_batch(self):
+        with self._ready:
+            while True:
+                if len(self._pending) >= self._batch_size:
+                    break
+                if self._pending:
+                    waited = time.monotonic() - self._pending[0][0]
+                    if waited >= self._max_delay:
+                        break
+                    self._ready.wait(self._max_delay - waited)
+                else:
+                    self._ready.wait()
+
+            count = min(self._batch_size, len(self._pending))
+            return [self._pending.popleft()[1] for _ in range(count)]
+
+    def _flush(self, batch):
+        """Persist one batch; returns False if it should be retried later"""
+        try:
+            self._write(batch)
+        except PERMANENT_ERRORS as e:
+            logger.error(f"❌ Claim batch rejected, retrying row by row: {e}")
+            self._write_individually(batch)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Claim batch failed ({len(batch)} claims), will retry: {e}")
+            return False
+
+        self._acknowledge(batch)
+        if self._on_persisted:
+            self._on_persisted(batch)
+        return True
+
+    def _write(self, records):
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                self._save_records(cursor, conn, records)
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _write_individually(self, batch):
+        persisted = []
+        failed = []
+        for record in batch:
+            try:
+                self._write([record])
+                persisted.append(record)
+            except PERMANENT_ERRORS as e:
+                logger.error(f"❌ Dropping claim for {record['codigo_estudiante']}: {e}")
+                failed.append(record)
+            except Exception:
+                # Connection trouble halfway through: retry the rest as a batch
+                with self._ready:
+                    remaining = batch[len(persisted) + len(failed):]
+                    self._pending.extendleft((time.monotonic(), r) for r in reversed(remaining))
+                break
+
+        self._acknowledge(persisted + failed)
+        if persisted and self._on_persisted:
+            self._on_persisted(persisted)
+        if failed and self._on_failed:
+            self._on_failed(failed)
+
+    # -------------------------------------------------------------------------
+    # Journal
+    # -------------------------------------------------------------------------
+    def _write_journal(self, entries):
+        # Caller holds _journal_lock
+        self._journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _acknowledge(self, records):
+        if not records:
+            return
+        ids = [record['claim_uid'] for record in records]
+
+        with self._journal_lock:
+            self._write_journal([{"op": "ack", "ids": ids}])
+            self._unacked.difference_update(ids)
+            if not self._unacked:
+                # Everything is in MySQL: start the journal over
+                self._journal.truncate(0)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+
+
+def _try_lock(path):
+    """Open file holding an exclusive lock on path, or None if another process has it"""
+    lock_file = open(path, "a+b")
+    try:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    # Held until the file is closed (or the process exits)
+    return lock_file
+
+
+def _trim_torn_write(path):
+    """Cut a partial last line left by a crash, so the next append starts a line of its own"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as journal:
+        data = journal.read()
+        if data and not data.endswith(b"\n"):
+            journal.truncate(data.rfind(b"\n") + 1)
+            journal.flush()
+            os.fsync(journal.fileno())
+            logger.warning(f"⚠️ Dropped a partial entry at the end of {path}")
+
+
+def _read_journal(path):
+    """Unacknowledged claims in a journal file"""
+    if not os.path.exists(path):
+        return []
+
+    records = {}
+    with open(path, "r", encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn write at the end of the file from a crash
+                continue
+            if entry["op"] == "claim":
+                record = _decode(entry["record"])
+                records[record['claim_uid']] = record
+            elif entry["op"] == "ack":
+                for claim_uid in entry["ids"]:
+                    records.pop(claim_uid, None)
+    return list(records.values())
+
+
+def _encode(record):
+    encoded = dict(record)
+    for key, value in record.items():
+        if isinstance(value, (date, datetime)):
+            encoded[key] = value.isoformat()
+    return encoded
+
+
+def _decode(record):
+    decoded = dict(record)
+    decoded['fecha_hora'] = datetime.fromisoformat(record['fecha_hora'])
+    decoded['day'] = date.fromisoformat(record['day'])
+    return decoded
@@ -0,0 +1,298 @@
+import argparse
+import itertools
+import socket
+import socketserver
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+
+# =============================================================================
+# ESC/POS TICKET RENDERING
+# =============================================================================
+# Same ticket as the Node.js printer server (server.js), built from
+# precompiled byte templates so each ticket is a handful of concatenations.
+
+ESC = b'\x1b'
+GS = b'\x1d'
+LF = b'\n'
+
+INIT = ESC + b'@'
+CENTER = ESC + b'a\x01'
+LARGE_BOLD_ON = GS + b'!\x11' + ESC + b'E\x01'    # Double width and height, bold
+LARGE_BOLD_OFF = ESC + b'E\x00' + GS + b'!\x00'   # Bold off, reset size
+CUT = GS + b'VA\x00'
+
+TICKET_HEADER = INIT + CENTER + LARGE_BOLD_ON
+NAME_FOOTER = LARGE_BOLD_OFF + LF
+KEYWORD_HEADER = LF + LARGE_BOLD_ON
+TICKET_FOOTER = LARGE_BOLD_OFF + LF + LF + CUT
+
+NAME_LINE_CHARS = 22
+
+# Daily keyword for validation (same rotation as server.js)
+PALABRAS = [
+    "FLI", "LEARN TO LEARN", "INDEPENDENT", "SOCIAL LEADER", "CITIZENSHIP",
+    "CARING", "KIND", "TEAM PLAYER", "COOKING", "FAIR",
+    "PERSONAL BEST", "LEARN TO BE", "INNOVATIVE", "ARTSSO", "SENIORS",
+    "CERRITOS", "RESPECTFUL", "FREEDOM", "COURAGEOUS", "FUNDACIÓN",
+    "WEECARE", "COLOMBIA", "THINK", "HUMBLE", "CHONTADURO",
+    "SPORTS", "VIADUCTO", "MOTIVATED", "LOYAL", "MULTICULTURAL",
+    "LICEO INGLÉS", "UNITED STATES", "LEADERSHIP", "SUCCESS", "EMPATHETIC",
+    "HONESTY", "PASSIONATE", "VOLLEYBALL", "SCIENCE", "LEADER",
+    "RELIABLE", "HONEST", "INTEGRITY", "LEARN TO THINK", "THOUGHTFUL",
+    "JAGGY", "RISARALDA", "GLOBAL CITIZEN", "LOVE IT!", "COFFEE",
+    "OPEN MINDED", "RISK TAKER", "CONSOTA", "HAPPY", "SOCCER",
+    "DIGNITY", "RESPONSIBLE", "TRUSTWORTHY", "OTÚN", "SIX-SEVEN",
+    "ACHIEVEMENT", "GLOBAL", "ROBOTICS", "DIGITAL", "PROACTIVE",
+    "PEREIRA", "NHS", "FLIMUN", "30 DE AGOSTO", "CREATIVE",
+    "AWARENESS", "NJHS", "COGNIA", "BILINGUAL", "UNDERSTANDING",
+    "AUTONOMOUS", "CIVIC", "GO JAGUARS"
+]
+
+
+def encode(text):
+    # The Node server writes the ticket as 'binary' (latin-1)
+    return text.encode("latin-1", errors="replace")
+
+
+def clean_text(text):
+    """Remove accents for better printer compatibility"""
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def wrap_text(text, max_chars_per_line):
+    """Split long names into lines of at most max_chars_per_line (whole words)"""
+    lines = []
+    current_line = ""
+    for word in text.split(" "):
+        test_line = f"{current_line} {word}" if current_line else word
+        if len(test_line) <= max_chars_per_line:
+            current_line = test_line
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line = word
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+
+@lru_cache(maxsize=8)
+def keyword_block(day_of_year):
+    """Daily keyword section, rendered once per day"""
+    palabra = PALABRAS[day_of_year % len(PALABRAS)].upper()
+    return KEYWORD_HEADER + encode(palabra) + LF + TICKET_FOOTER
+
+
+@lru_cache(maxsize=4096)
+def name_block(nombre):
+    """Wrapped, accent-free name lines (students rescan every day)"""
+    lines = wrap_text(clean_text(nombre.upper()), NAME_LINE_CHARS)
+    return TICKET_HEADER + b"".join(encode(line) + LF for line in lines) + NAME_FOOTER
+
+
+def format_ticket_time(when):
+    # Matches toLocaleTimeString('es-CO', {hour: '2-digit', minute: '2-digit', hour12: true})
+    suffix = "a. m." if when.hour < 12 else "p. m."
+    hour = when.hour % 12 or 12
+    return f"{when.day}/{when.month}/{when.year} {hour:02d}:{when.minute:02d} {suffix}"
+
+
+def render_ticket(nombre, tipo_alimentacion, when=None):
+    """Complete ESC/POS byte string for one ticket"""
+    when = when or datetime.now()
+    return b"".join((
+        name_block(nombre),
+        encode(format_ticket_time(when)), LF,
+        b"(", encode(tipo_alimentacion), b")", LF,
+        keyword_block(when.timetuple().tm_yday)
+    ))
+
+
+# =============================================================================
+# RAW SOCKET PRINTERS (port 9100)
+# =============================================================================
+
+class PrinterUnavailable(Exception):
+    """Raised when no configured printer accepted the ticket"""
+
+
+class RawPrinter:
+    """One network printer reached through a kept-alive raw TCP socket"""
+
+    def __init__(self, host, port=9100, timeout=3.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.in_flight = 0
+        self.down_until = 0.0
+        self._lock = threading.Lock()
+        self._socket = None
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+    def send(self, data):
+        with self._lock:
+            reused = self._socket is not None
+            # A failed fresh connect is not retried (it would wait out a second timeout)
+            connection = self._connection()
+            sent = 0
+            try:
+                view = memoryview(data)
+                while sent < len(data):
+                    sent += connection.send(view[sent:])
+            except OSError:
+                self.close()
+                if not reused or sent:
+                    # Part of the ticket may have printed: resending would print it twice
+                    raise
+                # Stale kept-alive connection that took nothing: reconnect once and resend
+                self._connection().sendall(data)
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+    def _connection(self):
+        if self._socket is None:
+            self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self._socket
+
+
+class PrinterPool:
+    """Spreads tickets over several printers, failing over to the next one"""
+
+    ROUND_ROBIN = "round_robin"
+    LEAST_BUSY = "least_busy"
+
+    def __init__(self, endpoints, strategy=ROUND_ROBIN, timeout=3.0, down_cooldown=10.0):
+        self.printers = [RawPrinter(host, port, timeout) for host, port in endpoints]
+        self.strategy = strategy
+        self.down_cooldown = down_cooldown
+        self._counter_lock = threading.Lock()
+        self._next = itertools.count()
+
+    @classmethod
+    def from_config(cls, endpoints, **kwargs):
+        """Build from "host" / "host:port" strings"""
+        parsed = []
+        for endpoint in endpoints:
+            host, _, port = endpoint.strip().partition(":")
+            parsed.append((host, int(port or 9100)))
+        return cls(parsed, **kwargs)
+
+    def send(self, data):
+        """Send one ticket; returns the printer that took it"""
+        errors = []
+        for printer in self._candidates():
+            with self._counter_lock:
+                printer.in_flight += 1
+            try:
+                printer.send(data)
+                printer.down_until = 0.0
+                return printer
+            except OSError as e:
+                # Skip this printer for a while instead of paying its timeout on every ticket
+                printer.down_until = time.monotonic() + self.down_cooldown
+                errors.append(f"{printer}: {e}")
+            finally:
+                with self._counter_lock:
+                    printer.in_flight -= 1
+        raise PrinterUnavailable("; ".join(errors))
+
+    def stats(self):
+        return {
+            "strategy": self.strategy,
+            "printers": [
+                {"printer": str(p), "in_flight": p.in_flight, "down": p.down_until > time.monotonic()}
+                for p in self.printers
+            ]
+        }
+
+    def _candidates(self):
+        """Every printer, preferred one first and recently failed ones last"""
+        if self.strategy == self.LEAST_BUSY:
+            ordered = sorted(self.printers, key=lambda printer: printer.in_flight)
+        else:
+            start = next(self._next) % len(self.printers)
+            ordered = self.printers[start:] + self.printers[:start]
+        now = time.monotonic()
+        return sorted(ordered, key=lambda printer: printer.down_until > now)
+
+
+# =============================================================================
+# FAKE PRINTER (for testing without hardware)
+# =============================================================================
+
+class FakePrinter:
+    """Local port-9100 style listener that collects tickets instead of printing"""
+
+    def __init__(self, host="127.0.0.1", port=9100, echo=False):
+        self.tickets = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                buffer = b""
+                while True:
+                    chunk = self.request.recv(4096)
+                    if not chunk:
+                        break
+                    buffer += chunk
+                    # A ticket is complete once the cut command arrives
+                    while CUT in buffer:
+                        ticket, buffer = buffer.split(CUT, 1)
+                        fake.received(ticket + CUT, echo)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+
+    def received(self, ticket, echo):
+        with self._lock:
+            self.tickets.append(ticket)
+        if echo:
+            print(f"🧾 Ticket {len(self.tickets)}:")
+            print(readable(ticket))
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever, name="fake-printer", daemon=True)
+        thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def readable(ticket):
+    """Ticket text without ESC/POS control sequences"""
+    text = ticket.decode("latin-1")
+    for command in (INIT, CENTER, LARGE_BOLD_ON, LARGE_BOLD_OFF, CUT):
+        text = text.replace(command.decode("latin-1"), "")
+    return text.strip("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake ESC/POS network printer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+
+    printer = FakePrinter(args.host, args.port, echo=True)
+    print(f"🖨️  Fake printer listening on {args.host}:{args.port}")
+    printer.serve_forever()
@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from queue import Queue, Full
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# WORKER LANES
+# =============================================================================
+# Each kind of background work (printing, persistence) gets its own bounded
+# queue and its own threads, so a slow printer never holds up database writes.
+
+
+class LaneFull(Exception):
+    """Raised when a lane is at capacity and cannot take more work"""
+
+
+class WorkerLane:
+    """Bounded queue served by a fixed number of worker threads"""
+
+    def __init__(self, name, handler, workers=1, max_depth=200, high_water=0.8):
+        self.name = name
+        self._handler = handler
+        self._workers = workers
+        self._max_depth = max_depth
+        self._high_water = int(max_depth * high_water)
+        self._queue = Queue(maxsize=max_depth)
+        self._threads = []
+
+        self._counter_lock = threading.Lock()
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self._workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-lane-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item):
+        """Queue work without blocking; raises LaneFull when at capacity"""
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except Full:
+            with self._counter_lock:
+                self._rejected += 1
+            raise LaneFull(f"{self.name} lane is full ({self._max_depth} items)")
+
+    @property
+    def saturated(self):
+        """True once the queue passes its high-water mark"""
+        return self._queue.qsize() >= self._high_water
+
+    def stats(self):
+        with self._queue.mutex:
+            depth = len(self._queue.queue)
+            oldest = self._queue.queue[0][0] if depth else None
+        return {
+            "workers": self._workers,
+            "depth": depth,
+            "capacity": self._max_depth,
+            "saturated": depth >= self._high_water,
+            "oldest_age_seconds": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+            "processed": self._processed,
+            "failed": self._failed,
+            "rejected": self._rejected
+        }
+
+    def _run(self):
+        while True:
+            _, item = self._queue.get()
+            try:
+                self._handler(item)
+                with self._counter_lock:
+                    self._processed += 1
+            except Exception as e:
+                logger.error(f"❌ {self.name} lane error: {e}")
+                with self._counter_lock:
+                    self._failed += 1
+            finally:
+                self._queue.task_done()
+
+
+# =============================================================================
+# CIRCUIT BREAKER
+# =============================================================================
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency until a cool-down has passed"""
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=15.0):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow(self):
+        """Whether a call may go through right now (one trial call when half-open)"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"✅ {self.name} circuit closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            # A failed trial call while half-open reopens the circuit right away
+            if self._state != CLOSED or self._failures >= self._failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"🔌 {self.name} circuit opened after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "failures": self._failures,
+                "reset_timeout_seconds": self._reset_timeout
+            }
+
+    def _current_state(self):
+        # Caller holds _lock
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self._reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
@@ -0,0 +1,203 @@
+import atexit
+import contextvars
+import json
+import logging
+import random
+import sys
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue, Full
+
+# =============================================================================
+# NON-BLOCKING LOGGING
+# =============================================================================
+# Request threads only put records on a queue; one listener thread formats
+# them and does the console I/O (slow on the Windows console). Records carry
+# the request's correlation id, success-path noise is sampled per request, and
+# the most recent events stay in memory for GET /logs.
+
+# (request_id, sampled) of the request or background task being handled
+_context = contextvars.ContextVar("log_context", default=(None, True))
+
+# Pass as extra= on chatty success-path lines so they can be sampled
+NOISE = {"noise": True}
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def begin_request(request_id=None):
+    """Tag this thread's records with a correlation id; returns the id"""
+    request_id = request_id or new_request_id()
+    sampled = _pipeline is None or random.random() < _pipeline.sample_rate
+    _context.set((request_id, sampled))
+    return request_id
+
+
+def end_request():
+    _context.set((None, True))
+
+
+def log_context():
+    """Current (request_id, sampled), to hand to a background task"""
+    return _context.get()
+
+
+@contextmanager
+def use_log_context(context):
+    """Log a background task under the request that queued it"""
+    token = _context.set(context or (None, True))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds request_id to records and drops noise from unsampled requests"""
+
+    def __init__(self):
+        super().__init__()
+        self.sampled_out = 0
+
+    def filter(self, record):
+        request_id, sampled = _context.get()
+        record.request_id = request_id or "-"
+        if not sampled and getattr(record, "noise", False) and record.levelno < logging.WARNING:
+            self.sampled_out += 1
+            return False
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the most recent events in memory for live troubleshooting"""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self._events = deque(maxlen=capacity)
+        self._events_lock = threading.Lock()
+
+    def emit(self, record):
+        event = event_fields(record)
+        with self._events_lock:
+            self._events.append(event)
+
+    def recent(self, limit=100, level=None, request_id=None):
+        """Newest events last, optionally only at/above a level or for one request"""
+        minimum = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(minimum, int):
+            minimum = logging.NOTSET
+        with self._events_lock:
+            events = list(self._events)
+        matched = [
+            event for event in events
+            if event["levelno"] >= minimum and (request_id is None or event["request_id"] == request_id)
+        ]
+        return matched[-limit:] if limit else matched
+
+    def __len__(self):
+        return len(self._events)
+
+
+def event_fields(record):
+    # Tracebacks are already folded into the message by QueueHandler.prepare()
+    return {
+        "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+        "level": record.levelname,
+        "levelno": record.levelno,
+        "logger": record.name,
+        "request_id": getattr(record, "request_id", "-"),
+        "message": record.getMessage()
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line (for log shippers)"""
+
+    def format(self, record):
+        event = event_fields(record)
+        del event["levelno"]
+        return json.dumps(event, ensure_ascii=False)
+
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(request_id)s] %(message)s"
+
+
+class LogPipeline:
+    """Queue handler on the root logger, drained by one listener thread"""
+
+    def __init__(self, sample_rate=1.0, ring_size=1000, json_format=False, queue_size=10000):
+        self.sample_rate = sample_rate
+        self.queue = Queue(maxsize=queue_size)
+
+        self.console = logging.StreamHandler(sys.stdout)
+        self.console.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT, "%H:%M:%S"))
+        self.ring = RingBufferHandler(ring_size)
+
+        self.context_filter = ContextFilter()
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.queue_handler.addFilter(self.context_filter)
+
+        self.listener = QueueListener(self.queue, self.console, self.ring, respect_handler_level=True)
+
+    def install(self, level):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(level)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # Flushes whatever is still queued
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def set_console_stream(self, stream):
+        """Point console output at a new stream (e.g. the UTF-8 wrapper on Windows)"""
+        self.console.setStream(stream)
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "dropped": self.queue_handler.dropped,
+            "sampled_out": self.context_filter.sampled_out,
+            "sample_rate": self.sample_rate,
+            "buffered_events": len(self.ring)
+        }
+
+
+_pipeline = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level="INFO", sample_rate=1.0, ring_size=1000, json_format=False):
+    """Install the pipeline once per process; later calls return the same one"""
+    global _pipeline
+    with _setup_lock:
+        if _pipeline is None:
+            pipeline = LogPipeline(sample_rate, ring_size, json_format)
+            pipeline.install(level)
+            _pipeline = pipeline
+    return _pipeline
@@ -0,0 +1,162 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# =============================================================================
+# LATENCY METRICS
+# =============================================================================
+# Fixed-bucket histograms (one lock + one bisect per observation, cheap enough
+# to leave on) rendered in the Prometheus text format for GET /metrics.
+
+# Bucket upper bounds in seconds, from sub-millisecond lookups to printer timeouts
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with quantile estimates"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)   # Last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def quantile(self, q, counts=None, count=None):
+        """Estimate by linear interpolation inside the bucket holding the q-th value"""
+        if counts is None:
+            counts, _, count = self.snapshot()
+        if not count:
+            return 0.0
+
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Per-stage latency histograms, counters and scrape-time gauges"""
+
+    def __init__(self, namespace="cafeteria"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+
+    @contextmanager
+    def time_stage(self, stage):
+        """Record how long the with-block takes under the given stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def increment(self, name, labels=(), amount=1):
+        """Add to a counter; labels is a tuple of (key, value) pairs"""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, read, help_text=""):
+        """Register a gauge whose value is read at scrape time"""
+        self._gauges[name] = (read, help_text)
+
+    def _stage_items(self):
+        # observe() may add a stage while a scrape is iterating
+        with self._lock:
+            return sorted(self._stages.items())
+
+    def summary(self):
+        """{stage: {count, p50, p95, p99}} in milliseconds, for JSON consumers"""
+        result = {}
+        for stage, histogram in self._stage_items():
+            counts, _, count = histogram.snapshot()
+            result[stage] = {"count": count}
+            for q in QUANTILES:
+                result[stage][f"p{int(q * 100)}"] = round(histogram.quantile(q, counts, count) * 1000, 3)
+        return result
+
+    def render(self):
+        """Prometheus text exposition format"""
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_stage_seconds Time spent in each hot-path stage",
+            f"# TYPE {ns}_stage_seconds histogram"
+        ]
+        quantile_lines = [
+            f"# HELP {ns}_stage_quantile_seconds Estimated latency quantiles per stage",
+            f"# TYPE {ns}_stage_quantile_seconds gauge"
+        ]
+        for stage, histogram in self._stage_items():
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{ns}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{ns}_stage_seconds_count{{stage="{stage}"}} {count}')
+            for q in QUANTILES:
+                value = histogram.quantile(q, counts, count)
+                quantile_lines.append(f'{ns}_stage_quantile_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+        lines.extend(quantile_lines)
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {ns}_{name} counter")
+                declared.add(name)
+            lines.append(f"{ns}_{name}{format_labels(labels)} {value}")
+
+        for name, (read, help_text) in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            if help_text:
+                lines.append(f"# HELP {ns}_{name} {help_text}")
+            lines.append(f"# TYPE {ns}_{name} gauge")
+            lines.append(f"{ns}_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
@@ -0,0 +1,287 @@
+import argparse
+from datetime import date, timedelta
+
+import mysql.connector
+
+# =============================================================================
+# SCHEMA MIGRATIONS
+# =============================================================================
+# Ordered, numbered schema changes for the cafeteria database. Applied versions
+# are recorded in `schema_migrations`, so running `upgrade` twice is a no-op.
+#
+#   python migrations.py status
+#   python migrations.py upgrade
+#   python migrations.py archive --keep-days 120
+#
+# Each migration is idempotent on its own: MySQL commits DDL implicitly, so a
+# migration interrupted halfway must be safe to run again.
+
+BACKFILL_CHUNK = 5000
+ARCHIVE_CHUNK = 2000
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def id_range(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM {table}")
+    return cursor.fetchone()
+
+
+# =============================================================================
+# MIGRATIONS
+# =============================================================================
+
+def create_base_tables(cursor, conn):
+    """Students and validation records (as documented in the README)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS estudiantes (
+            codigo_estudiante VARCHAR(50) PRIMARY KEY,
+            nombre VARCHAR(200) NOT NULL,
+            grado VARCHAR(20) NOT NULL,
+            tipo_alimentacion VARCHAR(50) NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS registros_validacion (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            codigo_estudiante VARCHAR(50) NOT NULL,
+            nombre VARCHAR(200) NOT NULL,
+            tipo_alimentacion VARCHAR(50) NOT NULL,
+            fecha_hora DATETIME NOT NULL,
+            plan VARCHAR(20) NOT NULL,
+            estado VARCHAR(20) NOT NULL,
+            INDEX idx_fecha (fecha_hora),
+            INDEX idx_codigo (codigo_estudiante)
+        )
+    """)
+
+
+def add_claim_uid(cursor, conn):
+    """Unique id per claim so journal replays cannot insert a record twice"""
+    if not column_exists(cursor, "registros_validacion", "claim_uid"):
+        cursor.execute("ALTER TABLE registros_validacion ADD COLUMN claim_uid CHAR(32) NULL")
+    if not index_exists(cursor, "registros_validacion", "uq_claim_uid"):
+        cursor.execute("ALTER TABLE registros_validacion ADD UNIQUE KEY uq_claim_uid (claim_uid)")
+
+
+def create_daily_claims(cursor, conn):
+    """Compact (student, day, service) table used by the duplicate check"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reclamos_diarios (
+            codigo_estudiante VARCHAR(50) NOT NULL,
+            fecha DATE NOT NULL,
+            plan VARCHAR(20) NOT NULL,
+            fecha_hora DATETIME NOT NULL,
+            PRIMARY KEY (codigo_estudiante, fecha, plan),
+            INDEX idx_fecha_plan (fecha, plan)
+        )
+    """)
+
+    # Backfill in id chunks so the live table is never locked for long
+    first_id, last_id = id_range(cursor, "registros_validacion")
+    start = first_id - 1
+    while start < last_id:
+        end = start + BACKFILL_CHUNK
+        cursor.execute("""
+            INSERT IGNORE INTO reclamos_diarios (codigo_estudiante, fecha, plan, fecha_hora)
+            SELECT codigo_estudiante, DATE(fecha_hora), plan, fecha_hora
+            FROM registros_validacion
+            WHERE id > %s AND id <= %s
+        """, (start, end))
+        conn.commit()
+        start = end
+        print(f"   backfilled up to id {min(end, last_id)} of {last_id}")
+
+
+def create_history_table(cursor, conn):
+    """Archive for claim records older than the retention window"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS registros_validacion_historico LIKE registros_validacion")
+
+
+def add_student_active_flag(cursor, conn):
+    """Soft-delete flag for students dropped by a roster import"""
+    if not column_exists(cursor, "estudiantes", "activo"):
+        cursor.execute("ALTER TABLE estudiantes ADD COLUMN activo TINYINT(1) NOT NULL DEFAULT 1")
+
+
+def create_claim_rollups(cursor, conn):
+    """Per day, service, grade and food plan claim counters for reports"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_reclamos (
+            fecha DATE NOT NULL,
+            plan VARCHAR(20) NOT NULL,
+            grado VARCHAR(20) NOT NULL,
+            tipo_alimentacion VARCHAR(50) NOT NULL,
+            total INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, plan, grado, tipo_alimentacion)
+        )
+    """)
+
+    # Rebuild one day at a time (REPLACE keeps a rerun from double counting).
+    # Records do not store the grade, so the student's current grade is used.
+    cursor.execute("""
+        SELECT MIN(first_day), MAX(last_day) FROM (
+            SELECT DATE(MIN(fecha_hora)) AS first_day, DATE(MAX(fecha_hora)) AS last_day FROM registros_validacion
+            UNION ALL
+            SELECT DATE(MIN(fecha_hora)), DATE(MAX(fecha_hora)) FROM registros_validacion_historico
+        ) bounds
+    """)
+    first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return
+
+    day = first_day
+    while day <= last_day:
+        next_day = day + timedelta(days=1)
+        cursor.execute("""
+            REPLACE INTO resumen_reclamos (fecha, plan, grado, tipo_alimentacion, total)
+            SELECT %s, r.plan, COALESCE(e.grado, ''), r.tipo_alimentacion, COUNT(*)
+            FROM (
+                SELECT codigo_estudiante, plan, tipo_alimentacion FROM registros_validacion
+                WHERE fecha_hora >= %s AND fecha_hora < %s
+                UNION ALL
+                SELECT codigo_estudiante, plan, tipo_alimentacion FROM registros_validacion_historico
+                WHERE fecha_hora >= %s AND fecha_hora < %s
+            ) r
+            LEFT JOIN estudiantes e ON e.codigo_estudiante = r.codigo_estudiante
+            GROUP BY r.plan, COALESCE(e.grado, ''), r.tipo_alimentacion
+        """, (day, day, next_day, day, next_day))
+        conn.commit()
+        day = next_day
+    print(f"   rollups rebuilt from {first_day} to {last_day}")
+
+
+MIGRATIONS = [
+    ("001_base_tables", create_base_tables),
+    ("002_claim_uid", add_claim_uid),
+    ("003_reclamos_diarios", create_daily_claims),
+    ("004_historial", create_history_table),
+    ("005_estudiantes_activo", add_student_active_flag),
+    ("006_resumen_reclamos", create_claim_rollups),
+]
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(50) PRIMARY KEY,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(conn):
+    cursor = conn.cursor()
+    try:
+        applied = applied_versions(cursor)
+    finally:
+        cursor.close()
+    return [(version, migration) for version, migration in MIGRATIONS if version not in applied]
+
+
+def upgrade(conn):
+    """Apply every pending migration in order; returns the versions applied"""
+    done = []
+    for version, migration in pending_migrations(conn):
+        print(f"🛠️  Applying {version}: {migration.__doc__}")
+        cursor = conn.cursor()
+        try:
+            migration(cursor, conn)
+            cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+        finally:
+            cursor.close()
+        done.append(version)
+    return done
+
+
+def archive(conn, keep_days):
+    """Move claim records older than keep_days into the history table"""
+    cutoff = date.today() - timedelta(days=keep_days)
+    cursor = conn.cursor()
+    moved = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id FROM registros_validacion
+                WHERE fecha_hora < %s
+                ORDER BY id
+                LIMIT %s
+            """, (cutoff, ARCHIVE_CHUNK))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+
+            # One short transaction per chunk keeps row locks brief
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"""
+                INSERT IGNORE INTO registros_validacion_historico
+                SELECT * FROM registros_validacion WHERE id IN ({placeholders})
+            """, ids)
+            cursor.execute(f"DELETE FROM registros_validacion WHERE id IN ({placeholders})", ids)
+            conn.commit()
+            moved += len(ids)
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    print(f"📦 Archived {moved} claim records older than {cutoff}")
+    return moved
+
+
+def main():
+    from server import db_config
+
+    parser = argparse.ArgumentParser(description="Cafeteria schema migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="list applied and pending migrations")
+    subparsers.add_parser("upgrade", help="apply pending migrations")
+    archive_parser = subparsers.add_parser("archive", help="move old claim records to history")
+    archive_parser.add_argument("--keep-days", type=int, default=180)
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**db_config)
+    try:
+        if args.command == "status":
+            pending = {version for version, _ in pending_migrations(conn)}
+            for version, migration in MIGRATIONS:
+                mark = "pending" if version in pending else "applied"
+                print(f"{version:<24} {mark:<8} {migration.__doc__}")
+        elif args.command == "upgrade":
+            applied = upgrade(conn)
+            print(f"✅ {len(applied)} migrations applied" if applied else "✅ Schema is up to date")
+        elif args.command == "archive":
+            archive(conn, args.keep_days)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import csv
+import io
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+# =============================================================================
+# CLAIM ROLLUPS AND REPORTS
+# =============================================================================
+# `resumen_reclamos` holds one counter per (day, service, grade, food plan).
+# It is updated in the same transaction that persists the claims, so reports
+# read a few hundred rows instead of scanning `registros_validacion` while
+# scanners are writing to it.
+
+ROLLUP_DIMENSIONS = ("fecha", "plan", "grado", "tipo_alimentacion")
+EXPORT_COLUMNS = (
+    "id", "claim_uid", "codigo_estudiante", "nombre", "tipo_alimentacion", "fecha_hora", "plan", "estado"
+)
+EXPORT_FETCH_ROWS = 1000
+EXPORT_MAX_DAYS = 400
+
+
+class ReportRangeError(ValueError):
+    """Raised for a missing, malformed or too long date range"""
+
+
+def existing_claim_uids(cursor, claim_uids):
+    """Which of these claims are already in registros_validacion (journal replays)"""
+    placeholders = ", ".join(["%s"] * len(claim_uids))
+    cursor.execute(
+        f"SELECT claim_uid FROM registros_validacion WHERE claim_uid IN ({placeholders})",
+        list(claim_uids)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def update_rollups(cursor, records):
+    """Add newly persisted claims to the counters (call inside the claim transaction)"""
+    totals = Counter(
+        (record['day'], record['plan'], record['grado'], record['tipo_alimentacion'])
+        for record in records
+    )
+    if not totals:
+        return
+    # Sorted so concurrent persist workers lock counter rows in the same order
+    cursor.executemany("""
+        INSERT INTO resumen_reclamos (fecha, plan, grado, tipo_alimentacion, total)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+    """, [(*key, count) for key, count in sorted(totals.items())])
+
+
+def parse_range(desde, hasta, max_days=EXPORT_MAX_DAYS):
+    """(first_day, last_day) from ISO dates; both default to today"""
+    try:
+        first = date.fromisoformat(desde) if desde else date.today()
+        last = date.fromisoformat(hasta) if hasta else first
+    except ValueError:
+        raise ReportRangeError("Dates must look like YYYY-MM-DD")
+    if last < first:
+        raise ReportRangeError("'hasta' is before 'desde'")
+    if (last - first).days >= max_days:
+        raise ReportRangeError(f"At most {max_days} days per request")
+    return first, last
+
+
+def parse_dimensions(value):
+    """Validated GROUP BY columns from "fecha,plan" style input"""
+    dimensions = [name.strip() for name in (value or "fecha,plan").split(",") if name.strip()]
+    unknown = [name for name in dimensions if name not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ReportRangeError(f"Unknown grouping: {', '.join(unknown)} (use {', '.join(ROLLUP_DIMENSIONS)})")
+    return dimensions
+
+
+def claim_summary(cursor, first, last, dimensions):
+    """Claim totals between two days, grouped by the given rollup columns"""
+    # Column names come from ROLLUP_DIMENSIONS only (see parse_dimensions)
+    columns = ", ".join(dimensions)
+    select = f"{columns}, SUM(total) AS total" if dimensions else "SUM(total) AS total"
+    group_by = f"GROUP BY {columns} ORDER BY {columns}" if dimensions else ""
+    cursor.execute(f"""
+        SELECT {select}
+        FROM resumen_reclamos
+        WHERE fecha BETWEEN %s AND %s
+        {group_by}
+    """, (first, last))
+
+    rows = []
+    for row in cursor.fetchall():
+        row['total'] = int(row['total'] or 0)
+        if 'fecha' in row:
+            row['fecha'] = row['fecha'].isoformat()
+        rows.append(row)
+    return rows
+
+
+def stream_claims_csv(conn, first, last):
+    """Yield CSV chunks of raw claims, archived ones first; closes conn when done"""
+    start = datetime.combine(first, time.min)
+    end = datetime.combine(last + timedelta(days=1), time.min)
+    columns = ", ".join(EXPORT_COLUMNS)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    try:
+        for table in ("registros_validacion_historico", "registros_validacion"):
+            # Unbuffered cursor: rows come off the socket as we write them out
+            cursor = conn.cursor(buffered=False)
+            cursor.execute(f"""
+                SELECT {columns} FROM {table}
+                WHERE fecha_hora >= %s AND fecha_hora < %s
+                ORDER BY fecha_hora
+            """, (start, end))
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            cursor.close()
+    finally:
+        # Also runs when the client disconnects mid-download
+        conn.close()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import threading
+from datetime import date
+
+# =============================================================================
+# CLAIM RESERVATIONS
+# =============================================================================
+# A claim is reserved before /verificar responds and stays reserved until the
+# INSERT is durable. Threads are serialized with an in-process lock; several
+# server processes on the same machine share marker files created with
+# O_CREAT | O_EXCL, which the OS guarantees only one caller can win.
+
+PENDING = "PENDING"
+CONFIRMED = "CONFIRMED"
+
+
+class ClaimReservations:
+    """Atomic (student, service, day) reservations shared by threads and processes"""
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._held = {}
+        self._day = date.today()
+        self._known_dirs = set()
+
+    def reserve(self, student_code, service_type, day=None):
+        """Take the claim; returns False if someone already holds it"""
+        today = date.today()
+        day = day or today
+        # Only the real date moves the day forward (a scan's own day never
+        # deletes today's markers)
+        if today > self._day:
+            self._rollover(today)
+
+        key = (day, service_type, student_code)
+        with self._lock:
+            if key in self._held:
+                return False
+            self._held[key] = PENDING
+
+        if self._directory and not self._create_marker(key):
+            with self._lock:
+                self._held.pop(key, None)
+            return False
+
+        return True
+
+    def confirm(self, student_code, service_type, day):
+        """The claim is durable; keep holding it for the rest of the day"""
+        key = (day, service_type, student_code)
+        with self._lock:
+            if key in self._held:
+                self._held[key] = CONFIRMED
+
+    def release(self, student_code, service_type, day):
+        """Persisting failed: give the claim back so the student can rescan"""
+        key = (day, service_type, student_code)
+        with self._lock:
+            self._held.pop(key, None)
+
+        if self._directory:
+            try:
+                os.remove(self._marker_path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            states = list(self._held.values())
+        return {
+            "day": self._day.isoformat(),
+            "pending": states.count(PENDING),
+            "confirmed": states.count(CONFIRMED),
+            "shared_directory": self._directory
+        }
+
+    # -------------------------------------------------------------------------
+    # Cross-process markers
+    # -------------------------------------------------------------------------
+    def _marker_path(self, key):
+        day, service_type, student_code = key
+        # Barcodes are usually digits, hex-encode anything else to stay path safe
+        name = student_code if student_code.isalnum() else student_code.encode("utf-8").hex()
+        return os.path.join(self._directory, day.isoformat(), service_type, name)
+
+    def _create_marker(self, key):
+        path = self._marker_path(key)
+        folder = os.path.dirname(path)
+        if folder not in self._known_dirs:
+            os.makedirs(folder, exist_ok=True)
+            self._known_dirs.add(folder)
+
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def _rollover(self, day):
+        with self._lock:
+            if day <= self._day:
+                return
+            self._day = day
+            self._held = {key: state for key, state in self._held.items() if key[0] >= day}
+            self._known_dirs = set()
+
+        if not self._directory or not os.path.isdir(self._directory):
+            return
+
+        # Markers from previous days are no longer needed
+        for entry in os.listdir(self._directory):
+            if entry < day.isoformat():
+                shutil.rmtree(os.path.join(self._directory, entry), ignore_errors=True)
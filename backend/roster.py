@@ -0,0 +1,290 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# IN-MEMORY STUDENT ROSTER
+# =============================================================================
+# Keeps an indexed copy of `estudiantes` plus the set of students that already
+# claimed each service today, so /verificar can answer without touching MySQL.
+# All database reads happen on a background thread. After every full load the
+# roster is saved to a local snapshot, which is used when MySQL is unreachable.
+
+STUDENT_COLUMNS = "codigo_estudiante, nombre, grado, tipo_alimentacion"
+RELOAD_CHUNK = 500              # Codes per IN (...) when refreshing single students
+
+
+class StudentRoster:
+    """Indexed roster of students and today's claims per service"""
+
+    def __init__(self, get_connection, refresh_interval=300, snapshot=None, degraded_retry_interval=10,
+                 database_down=None):
+        self._get_connection = get_connection
+        self._database_down = database_down     # () -> True once other callers found MySQL down
+        self._refresh_interval = refresh_interval
+        self._snapshot = snapshot
+        self._degraded_retry_interval = degraded_retry_interval
+        self._lock = threading.Lock()
+        self._students = {}
+        self._claimed = {}
+        self._day = date.today()
+        self._loaded = False
+        self._source = None
+        self._degraded = False
+        self._last_refresh = None
+
+        # Pending background work
+        self._wakeup = threading.Event()
+        self._full_reload = False
+        self._pending_codes = set()
+        self._thread = None
+
+    # -------------------------------------------------------------------------
+    # Read path (hot)
+    # -------------------------------------------------------------------------
+    @property
+    def loaded(self):
+        return self._loaded
+
+    @property
+    def degraded(self):
+        """True while MySQL cannot be read (serving the snapshot or the last good load)"""
+        if self._degraded:
+            return True
+        return self._loaded and self._database_down is not None and self._database_down()
+
+    def lookup(self, student_code, service_type):
+        """Same shape as get_student_with_claim_check, answered from memory"""
+        self._check_rollover()
+        student = self._students.get(student_code)
+        if student is None:
+            return None
+
+        claimed = self._claimed.get(service_type, ())
+        result = dict(student)
+        result['claim_count'] = 1 if student_code in claimed else 0
+        return result
+
+    def grade(self, student_code):
+        """Grade of an active student, or None"""
+        student = self._students.get(student_code)
+        return student['grado'] if student else None
+
+    def mark_claimed(self, student_code, service_type, day=None):
+        """Record a claim made by this process for today's service"""
+        if day is not None and day != self._day:
+            return
+        with self._lock:
+            self._claimed.setdefault(service_type, set()).add(student_code)
+
+    def stats(self):
+        return {
+            "loaded": self._loaded,
+            "source": self._source,
+            "degraded": self.degraded,
+            "students": len(self._students),
+            "day": self._day.isoformat(),
+            "claimed": {service: len(codes) for service, codes in self._claimed.items()},
+            "last_refresh": self._last_refresh.isoformat() if self._last_refresh else None
+        }
+
+    # -------------------------------------------------------------------------
+    # Invalidation
+    # -------------------------------------------------------------------------
+    def invalidate(self, student_code=None):
+        """Schedule a background reload of one student or of the whole roster"""
+        with self._lock:
+            if student_code is None:
+                self._full_reload = True
+            else:
+                self._pending_codes.add(student_code)
+        self._wakeup.set()
+
+    def invalidate_students(self, student_codes):
+        """Schedule a background reload of just these students"""
+        with self._lock:
+            self._pending_codes.update(student_codes)
+        self._wakeup.set()
+
+    def _check_rollover(self):
+        today = date.today()
+        if today == self._day:
+            return
+        with self._lock:
+            if today != self._day:
+                # New day: nobody has claimed anything yet, reload in background
+                self._day = today
+                self._claimed = {}
+                self._full_reload = True
+        self._wakeup.set()
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Start the background refresher (loads on that thread unless already loaded)"""
+        if self._thread is not None:
+            return
+        if not self._loaded:
+            self._full_reload = True
+            self._wakeup.set()
+        self._thread = threading.Thread(target=self._run, name="roster-refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            # While degraded, look for MySQL again much sooner (and poll as often
+            # when told about outages, so one is noticed within seconds)
+            if self.degraded or self._database_down is not None:
+                interval = self._degraded_retry_interval
+            else:
+                interval = self._refresh_interval
+            self._wakeup.wait(timeout=interval)
+            self._wakeup.clear()
+            self._check_rollover()
+
+            with self._lock:
+                # Coming back from an outage: reload everything that may have changed
+                full_reload = self._full_reload or not self._loaded or self.degraded
+                codes = self._pending_codes
+                self._full_reload = False
+                self._pending_codes = set()
+
+            try:
+                if full_reload or self._last_refresh_is_stale():
+                    self.reload()
+                elif codes:
+                    self.reload_students(codes)
+            except Exception as e:
+                logger.error(f"❌ Roster refresh error: {e}")
+                if not self._loaded:
+                    self.load_snapshot()
+                elif not self._degraded:
+                    # Lost MySQL mid-service: keep answering from memory
+                    self._degraded = True
+                    logger.warning("⚠️ DEGRADED MODE: database unreachable, serving the roster loaded at "
+                                   f"{self._last_refresh:%H:%M}")
+                # Retry the same work on the next pass
+                with self._lock:
+                    self._full_reload = self._full_reload or full_reload
+                    self._pending_codes |= codes
+
+    def _last_refresh_is_stale(self):
+        if self._last_refresh is None:
+            return True
+        return datetime.now() - self._last_refresh >= timedelta(seconds=self._refresh_interval)
+
+    def reload(self):
+        """Load every student and today's claims from the database"""
+        day = date.today()
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"SELECT {STUDENT_COLUMNS} FROM estudiantes WHERE activo = 1")
+            students = {row['codigo_estudiante']: row for row in cursor.fetchall()}
+            claimed = self._fetch_claims(cursor, day)
+            cursor.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            if day == self._day:
+                # Keep claims this process made while the query was running
+                for service_type, codes in self._claimed.items():
+                    claimed.setdefault(service_type, set()).update(codes)
+            self._students = students
+            self._claimed = claimed
+            self._day = day
+            self._loaded = True
+            self._source = "database"
+            self._degraded = False
+            self._last_refresh = datetime.now()
+            claimed_copy = {service_type: set(codes) for service_type, codes in claimed.items()}
+
+        logger.info(f"📚 Roster loaded: {len(students)} students")
+
+        if self._snapshot:
+            try:
+                self._snapshot.save(students, claimed_copy, day)
+            except Exception as e:
+                logger.error(f"❌ Roster snapshot error: {e}")
+
+    def load_snapshot(self):
+        """Serve from the local snapshot (MySQL unreachable); returns True if loaded"""
+        if not self._snapshot:
+            return False
+        try:
+            loaded = self._snapshot.load()
+        except Exception as e:
+            logger.error(f"❌ Could not read roster snapshot: {e}")
+            return False
+        if loaded is None:
+            return False
+
+        students, claimed, day, taken_at = loaded
+        today = date.today()
+        with self._lock:
+            if self._loaded:
+                return True
+            if day != today:
+                # Yesterday's claims do not count today
+                claimed = {}
+            for service_type, codes in self._claimed.items():
+                claimed.setdefault(service_type, set()).update(codes)
+            self._students = students
+            self._claimed = claimed
+            self._day = today
+            self._loaded = True
+            self._source = "snapshot"
+            self._degraded = True
+
+        logger.warning(f"⚠️ DEGRADED MODE: roster loaded from snapshot taken {taken_at:%Y-%m-%d %H:%M} ({len(students)} students)")
+        return True
+
+    def reload_students(self, student_codes):
+        """Refresh only the given students (e.g. after treasury edits)"""
+        codes = list(student_codes)
+        if not codes:
+            return
+
+        rows = {}
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            for start in range(0, len(codes), RELOAD_CHUNK):
+                chunk = codes[start:start + RELOAD_CHUNK]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT {STUDENT_COLUMNS} FROM estudiantes WHERE codigo_estudiante IN ({placeholders}) AND activo = 1",
+                    chunk
+                )
+                rows.update((row['codigo_estudiante'], row) for row in cursor.fetchall())
+            cursor.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            students = dict(self._students)
+            for code in codes:
+                if code in rows:
+                    students[code] = rows[code]
+                else:
+                    # Deleted or deactivated
+                    students.pop(code, None)
+            self._students = students
+
+        logger.info(f"📚 Roster refreshed: {len(codes)} students")
+
+    def _fetch_claims(self, cursor, day):
+        cursor.execute("""
+            SELECT codigo_estudiante, plan
+            FROM reclamos_diarios
+            WHERE fecha = %s
+        """, (day,))
+
+        claimed = {}
+        for row in cursor.fetchall():
+            claimed.setdefault(row['plan'], set()).add(row['codigo_estudiante'])
+        return claimed
@@ -0,0 +1,230 @@
+import argparse
+import csv
+import json
+import sys
+from itertools import islice
+
+import mysql.connector
+import requests
+
+# =============================================================================
+# BULK ROSTER IMPORT
+# =============================================================================
+# Streams a treasury CSV (codigo_estudiante, nombre, grado, tipo_alimentacion)
+# in chunks, diffs each chunk against `estudiantes` by primary key and applies
+# only what changed: inserts, updates, reactivations, and deactivation of
+# active students missing from the file. Reading and diffing take no locks.
+# The changes are then written in one short transaction of chunked multi-row
+# statements, which lock only the changed rows. /verificar answers from the
+# in-memory roster and never waits on them.
+#
+#   python roster_import.py estudiantes.csv --dry-run
+#   python roster_import.py estudiantes.csv --notify http://localhost:5000
+
+IMPORT_COLUMNS = ("codigo_estudiante", "nombre", "grado", "tipo_alimentacion")
+DIFF_FIELDS = ("nombre", "grado", "tipo_alimentacion")
+IMPORT_CHUNK = 500
+
+
+class RosterImportError(ValueError):
+    """Raised for a malformed roster file (nothing is written)"""
+
+
+def read_roster_csv(stream):
+    """Yield one clean row dict per CSV line; stream is a text file object"""
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        raise RosterImportError("Empty roster file")
+
+    header = {name.strip().lower(): name for name in reader.fieldnames if name}
+    missing = [column for column in IMPORT_COLUMNS if column not in header]
+    if missing:
+        raise RosterImportError(f"Missing columns: {', '.join(missing)}")
+
+    for line_number, raw in enumerate(reader, start=2):
+        row = {column: (raw.get(header[column]) or "").strip() for column in IMPORT_COLUMNS}
+        if not any(row.values()):
+            continue
+        if not row['codigo_estudiante'] or not row['nombre'] or not row['grado']:
+            raise RosterImportError(f"Line {line_number}: codigo_estudiante, nombre and grado are required")
+        row['tipo_alimentacion'] = row['tipo_alimentacion'].upper() or "NINGUNO"
+        yield row
+
+
+def chunked(rows, size):
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def fetch_existing(cursor, codes):
+    placeholders = ", ".join(["%s"] * len(codes))
+    cursor.execute(f"""
+        SELECT codigo_estudiante, nombre, grado, tipo_alimentacion, activo
+        FROM estudiantes
+        WHERE codigo_estudiante IN ({placeholders})
+    """, codes)
+    return {row['codigo_estudiante']: row for row in cursor.fetchall()}
+
+
+def active_codes(cursor, chunk_size):
+    """Every active student code, paged by primary key"""
+    last_code = ""
+    while True:
+        cursor.execute("""
+            SELECT codigo_estudiante FROM estudiantes
+            WHERE activo = 1 AND codigo_estudiante > %s
+            ORDER BY codigo_estudiante
+            LIMIT %s
+        """, (last_code, chunk_size))
+        codes = [row['codigo_estudiante'] for row in cursor.fetchall()]
+        if not codes:
+            return
+        yield from codes
+        last_code = codes[-1]
+
+
+def diff_roster(cursor, rows, chunk_size=IMPORT_CHUNK, deactivate_missing=True):
+    """Compare the file with the table; returns the plan of changes"""
+    plan = {"inserted": [], "updated": [], "reactivated": [], "deactivated": [], "unchanged": 0}
+    upserts = []
+    seen = set()
+
+    for chunk in chunked(rows, chunk_size):
+        codes = []
+        for row in chunk:
+            if row['codigo_estudiante'] in seen:
+                raise RosterImportError(f"Duplicate codigo_estudiante {row['codigo_estudiante']}")
+            seen.add(row['codigo_estudiante'])
+            codes.append(row['codigo_estudiante'])
+
+        existing = fetch_existing(cursor, codes)
+        for row in chunk:
+            code = row['codigo_estudiante']
+            current = existing.get(code)
+            if current is None:
+                plan["inserted"].append(code)
+                upserts.append(row)
+                continue
+
+            changes = {
+                field: [current[field], row[field]]
+                for field in DIFF_FIELDS if current[field] != row[field]
+            }
+            if changes:
+                plan["updated"].append({"codigo_estudiante": code, "changes": changes})
+            if not current['activo']:
+                plan["reactivated"].append(code)
+            if changes or not current['activo']:
+                upserts.append(row)
+            else:
+                plan["unchanged"] += 1
+
+    if deactivate_missing:
+        plan["deactivated"] = [code for code in active_codes(cursor, chunk_size) if code not in seen]
+
+    return plan, upserts
+
+
+def apply_roster_changes(conn, upserts, deactivated, chunk_size=IMPORT_CHUNK):
+    """Write the diff in one transaction of chunked multi-row statements"""
+    # executemany() sends this as a single multi-row INSERT per chunk
+    upsert_sql = """
+        INSERT INTO estudiantes (codigo_estudiante, nombre, grado, tipo_alimentacion, activo)
+        VALUES (%s, %s, %s, %s, 1)
+        ON DUPLICATE KEY UPDATE
+            nombre = VALUES(nombre),
+            grado = VALUES(grado),
+            tipo_alimentacion = VALUES(tipo_alimentacion),
+            activo = 1
+    """
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(upserts), chunk_size):
+            cursor.executemany(upsert_sql, [
+                tuple(row[column] for column in IMPORT_COLUMNS)
+                for row in upserts[start:start + chunk_size]
+            ])
+        for start in range(0, len(deactivated), chunk_size):
+            chunk = deactivated[start:start + chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"UPDATE estudiantes SET activo = 0 WHERE codigo_estudiante IN ({placeholders})",
+                chunk
+            )
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_roster(conn, rows, chunk_size=IMPORT_CHUNK, deactivate_missing=True, dry_run=False):
+    """Diff and apply a roster; returns the report of what changed"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        plan, upserts = diff_roster(cursor, rows, chunk_size, deactivate_missing)
+    finally:
+        cursor.close()
+
+    if not dry_run and (upserts or plan["deactivated"]):
+        apply_roster_changes(conn, upserts, plan["deactivated"], chunk_size)
+
+    plan["dry_run"] = dry_run
+    plan["counts"] = {
+        "inserted": len(plan["inserted"]),
+        "updated": len(plan["updated"]),
+        "reactivated": len(plan["reactivated"]),
+        "deactivated": len(plan["deactivated"]),
+        "unchanged": plan["unchanged"]
+    }
+    return plan
+
+
+def affected_codes(report):
+    """Student codes whose roster entry changed"""
+    return (
+        set(report["inserted"]) | set(report["reactivated"]) | set(report["deactivated"])
+        | {change["codigo_estudiante"] for change in report["updated"]}
+    )
+
+
+def main():
+    from server import db_config
+
+    parser = argparse.ArgumentParser(description="Import the student roster from a CSV file")
+    parser.add_argument("csv_file", help="CSV with codigo_estudiante, nombre, grado, tipo_alimentacion")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without writing them")
+    parser.add_argument("--keep-missing", action="store_true",
+                        help="do not deactivate students missing from the file (partial file)")
+    parser.add_argument("--notify", metavar="URL",
+                        help="running backend to refresh afterwards, e.g. http://localhost:5000")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**db_config)
+    try:
+        with open(args.csv_file, "r", encoding="utf-8-sig", newline="") as stream:
+            report = import_roster(
+                conn, read_roster_csv(stream),
+                deactivate_missing=not args.keep_missing, dry_run=args.dry_run
+            )
+    except RosterImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    codes = sorted(affected_codes(report))
+    if args.notify and codes and not args.dry_run:
+        response = requests.post(f"{args.notify.rstrip('/')}/roster/reload", json={"codigos": codes}, timeout=10)
+        print(f"🔄 Backend refresh: {response.status_code}")
+
+
+if __name__ == "__main__":
+    main()
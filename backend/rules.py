@@ -0,0 +1,339 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SERVICE CALENDAR AND ELIGIBILITY RULES
+# =============================================================================
+# Service hours, holidays, half days, per-grade windows, blocked homerooms and
+# which food plans may take which service are read from rules.json. Each day's
+# calendar is compiled once into a minute-by-minute table, so a scan is
+# answered with a couple of dict/list lookups. The file is watched and
+# reloaded without a restart; a broken edit keeps the previous rules.
+#
+#   python rules.py check "2026-11-27 12:45" --grado 11 --plan ALMUERZO
+#   python rules.py calendar 2026-11-27
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+MINUTES_PER_DAY = 24 * 60
+WEEKDAYS = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+COMPILED_DAYS_MAX = 16          # Batch syncs may span a few past days
+ELIGIBILITY_CACHE_MAX = 1024
+
+# Same rules the backend used before they moved to rules.json
+DEFAULT_RULES = {
+    "services": {
+        "SNACK": {"start": "06:00", "end": "11:20", "plan_keywords": ["REFRIGERIO"]},
+        "LUNCH": {"start": "11:20", "end": "18:00", "plan_keywords": ["ALMUERZO"]}
+    },
+    "service_days": list(WEEKDAYS),
+    "blocked_grades": ["K2", "K3", "K4", "K5", "1", "2"],
+    "grade_windows": {},
+    "holidays": [],
+    "half_days": {}
+}
+
+
+class RulesError(ValueError):
+    """Raised for a rules file that cannot be used"""
+
+
+def parse_minute(value):
+    """Minute of the day from "HH:MM" ("24:00" is the end of the day)"""
+    try:
+        hours, minutes = (int(part) for part in value.split(":"))
+    except (AttributeError, ValueError):
+        raise RulesError(f"Bad time {value!r}, expected HH:MM")
+    minute = hours * 60 + minutes
+    if not 0 <= minutes < 60 or not 0 <= minute <= MINUTES_PER_DAY:
+        raise RulesError(f"Bad time {value!r}, expected HH:MM")
+    return minute
+
+
+def format_minute(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def parse_window(window, where):
+    start, end = parse_minute(window.get("start")), parse_minute(window.get("end"))
+    if end <= start:
+        raise RulesError(f"{where}: end must be after start")
+    return start, end
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RulesError(f"Bad date {value!r}, expected YYYY-MM-DD")
+
+
+class DayCalendar:
+    """One day's compiled service tables (index = minute of the day)"""
+
+    def __init__(self, day, services, default, by_grade, windows, grade_windows):
+        self.day = day
+        self.services = services        # [service or None] * 1440, open for anyone
+        self.default = default          # Same, for grades without their own windows
+        self.by_grade = by_grade        # {grado: [service or None] * 1440} where a grade differs
+        self.windows = windows          # {service: (start, end)} for describe()
+        self.grade_windows = grade_windows
+
+
+class RuleSet:
+    """Validated rules plus compiled per-day tables (immutable once built)"""
+
+    def __init__(self, config):
+        services = config.get("services")
+        if not services:
+            raise RulesError("At least one service is required")
+
+        self.service_windows = {}
+        self.plan_keywords = {}
+        for service, spec in services.items():
+            self.service_windows[service] = parse_window(spec, f"services.{service}")
+            self.plan_keywords[service] = tuple(keyword.upper() for keyword in spec.get("plan_keywords", ()))
+
+        days = [day.upper() for day in config.get("service_days", WEEKDAYS)]
+        unknown = [day for day in days if day not in WEEKDAYS]
+        if unknown:
+            raise RulesError(f"Unknown service_days: {', '.join(unknown)}")
+        self.service_days = frozenset(WEEKDAYS.index(day) for day in days)
+
+        self.blocked_grades = frozenset(str(grado) for grado in config.get("blocked_grades", ()))
+
+        self.grade_windows = {}
+        for grado, windows in config.get("grade_windows", {}).items():
+            for service, window in windows.items():
+                if service not in self.service_windows:
+                    raise RulesError(f"grade_windows.{grado}: unknown service {service}")
+                self.grade_windows.setdefault(str(grado), {})[service] = parse_window(
+                    window, f"grade_windows.{grado}.{service}"
+                )
+
+        self.holidays = frozenset(parse_day(day) for day in config.get("holidays", ()))
+        # Half days: every service closes at the given time
+        self.half_days = {
+            parse_day(day): parse_minute(spec.get("end") if isinstance(spec, dict) else spec)
+            for day, spec in config.get("half_days", {}).items()
+        }
+
+        self._lock = threading.Lock()
+        self._days = {}
+        self._eligibility = {}
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path, "r", encoding="utf-8") as rules_file:
+                config = json.load(rules_file)
+        except json.JSONDecodeError as e:
+            raise RulesError(f"{path}: {e}")
+        return cls(config)
+
+    # -------------------------------------------------------------------------
+    # Per-scan lookups
+    # -------------------------------------------------------------------------
+    def service_at(self, at):
+        """Service open for anyone at this datetime, or None"""
+        return self.calendar(at.date()).services[at.hour * 60 + at.minute]
+
+    def service_for(self, grado, at):
+        """Service open for this grade at this datetime (grade windows can differ), or None"""
+        calendar = self.calendar(at.date())
+        table = calendar.by_grade.get(grado, calendar.default)
+        return table[at.hour * 60 + at.minute]
+
+    def is_blocked(self, grado):
+        return grado in self.blocked_grades
+
+    def is_eligible(self, food_type, service):
+        """May students on this food plan take this service"""
+        services = self._eligibility.get(food_type)
+        if services is None:
+            upper = (food_type or "").upper()
+            services = frozenset(
+                name for name, keywords in self.plan_keywords.items()
+                if any(keyword in upper for keyword in keywords)
+            )
+            if len(self._eligibility) < ELIGIBILITY_CACHE_MAX:
+                self._eligibility[food_type] = services
+        return service in services
+
+    # -------------------------------------------------------------------------
+    # Compilation
+    # -------------------------------------------------------------------------
+    def calendar(self, day):
+        calendar = self._days.get(day)
+        if calendar is None:
+            calendar = self._compile(day)
+            with self._lock:
+                if len(self._days) >= COMPILED_DAYS_MAX:
+                    self._days.pop(min(self._days))
+                self._days[day] = calendar
+        return calendar
+
+    def _compile(self, day):
+        closed = day in self.holidays or day.weekday() not in self.service_days
+        closes_at = self.half_days.get(day, MINUTES_PER_DAY)
+
+        def clip(windows):
+            if closed:
+                return {}
+            clipped = {}
+            for service, (start, end) in windows.items():
+                end = min(end, closes_at)
+                if end > start:
+                    clipped[service] = (start, end)
+            return clipped
+
+        def table(windows, own=()):
+            minutes = [None] * MINUTES_PER_DAY
+            # A grade's own windows are written last, so they win where they overlap
+            for service in sorted(windows, key=lambda name: name in own):
+                start, end = windows[service]
+                minutes[start:end] = [service] * (end - start)
+            return minutes
+
+        windows = clip(self.service_windows)
+        grade_windows = {grado: clip({**self.service_windows, **own}) for grado, own in self.grade_windows.items()}
+        by_grade = {grado: table(grade_windows[grado], own) for grado, own in self.grade_windows.items()}
+
+        # Open for anyone: the general windows, plus grade windows outside them
+        default = table(windows)
+        services = list(default)
+        for grade_table in by_grade.values():
+            for minute, service in enumerate(grade_table):
+                if service and services[minute] is None:
+                    services[minute] = service
+
+        return DayCalendar(day, services, default, by_grade, windows, grade_windows)
+
+    def describe(self, day):
+        """Readable calendar for a day (for /current_service and the CLI)"""
+        calendar = self.calendar(day)
+        return {
+            "date": day.isoformat(),
+            "holiday": day in self.holidays,
+            "half_day_until": format_minute(self.half_days[day]) if day in self.half_days else None,
+            "services": {
+                service: {"start": format_minute(start), "end": format_minute(end)}
+                for service, (start, end) in calendar.windows.items()
+            },
+            "grade_windows": {
+                grado: {
+                    service: {"start": format_minute(start), "end": format_minute(end)}
+                    for service, (start, end) in windows.items()
+                }
+                for grado, windows in calendar.grade_windows.items()
+            },
+            "blocked_grades": sorted(self.blocked_grades)
+        }
+
+
+class RuleEngine:
+    """Current RuleSet, swapped atomically when rules.json changes"""
+
+    def __init__(self, path=RULES_PATH, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self._mtime = None
+        self._loaded_at = None
+        self._last_error = None
+        self._thread = None
+        self.rules = self._load_initial()
+
+    def _load_initial(self):
+        if not os.path.exists(self.path):
+            logger.warning(f"⚠️ {self.path} not found, using built-in rules")
+            rules = RuleSet(DEFAULT_RULES)
+        else:
+            self._mtime = os.path.getmtime(self.path)
+            self._loaded_at = datetime.now()
+            rules = RuleSet.from_file(self.path)
+        # Compile today up front so the first scan does not pay for it
+        rules.calendar(date.today())
+        return rules
+
+    def reload(self):
+        """Re-read the rules file; returns True if the new rules are in use"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            rules = RuleSet.from_file(self.path)
+        except (OSError, RulesError) as e:
+            self._last_error = str(e)
+            logger.error(f"❌ Rules not reloaded, keeping previous rules: {e}")
+            return False
+
+        rules.calendar(date.today())
+        self.rules = rules
+        self._mtime = mtime
+        self._loaded_at = datetime.now()
+        self._last_error = None
+        logger.info(f"📅 Rules reloaded from {self.path}")
+        return True
+
+    def start(self):
+        """Watch the rules file for changes"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        wakeup = threading.Event()
+        while True:
+            wakeup.wait(self.check_interval)
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.reload()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "loaded_at": self._loaded_at.isoformat() if self._loaded_at else None,
+            "last_error": self._last_error
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the cafeteria service rules")
+    parser.add_argument("--rules", default=RULES_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    check_parser = subparsers.add_parser("check", help="decide one scan at a simulated date and time")
+    check_parser.add_argument("at", help='e.g. "2026-11-27 12:45"')
+    check_parser.add_argument("--grado")
+    check_parser.add_argument("--plan", help="tipo_alimentacion, e.g. ALMUERZO")
+    calendar_parser = subparsers.add_parser("calendar", help="show the compiled calendar of a day")
+    calendar_parser.add_argument("day", nargs="?", default=date.today().isoformat())
+    args = parser.parse_args()
+
+    rules = RuleSet.from_file(args.rules) if os.path.exists(args.rules) else RuleSet(DEFAULT_RULES)
+
+    if args.command == "calendar":
+        print(json.dumps(rules.describe(parse_day(args.day)), indent=2))
+        return
+
+    at = datetime.fromisoformat(args.at)
+    service = rules.service_at(at)
+    decision = {"at": at.isoformat(), "service": service}
+    if args.grado is not None:
+        service = rules.service_for(args.grado, at)
+        decision["grade_service"] = service
+        decision["blocked"] = rules.is_blocked(args.grado)
+    if service and args.plan is not None:
+        decision["eligible"] = rules.is_eligible(args.plan, service)
+    print(json.dumps(decision, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+# =============================================================================
+# REPEATED SCAN COALESCING
+# =============================================================================
+# Scanners often fire the same code two or three times within a few hundred
+# milliseconds. Concurrent reads of one code share a single evaluation
+# (single-flight), and the outcome is replayed to further reads for a short
+# window, so the student sees the same answer instead of "already claimed".
+
+
+class _Flight:
+    """One evaluation in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ScanCoalescer:
+    """Single-flight evaluation plus a bounded, time-expiring result cache"""
+
+    def __init__(self, ttl=3.0, max_entries=2048, cacheable=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cacheable = cacheable or (lambda result: True)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()    # key -> (expires_at, result), oldest first
+        self._flights = {}
+
+        self._hits = 0
+        self._coalesced = 0
+        self._misses = 0
+
+    def run(self, key, evaluate):
+        """(result, source) where source is "cache", "coalesced" or "evaluated" """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                if cached[0] > now:
+                    self._hits += 1
+                    return cached[1], "cache"
+                del self._cache[key]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._misses += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, "coalesced"
+
+        try:
+            flight.result = evaluate()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and self.ttl > 0 and self._cacheable(flight.result):
+                    self._store(key, flight.result)
+            flight.done.set()
+
+        return flight.result, "evaluated"
+
+    def invalidate(self, match=None):
+        """Forget cached results (all, or those whose key satisfies match)"""
+        with self._lock:
+            if match is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if match(key)]:
+                del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl,
+                "entries": len(self._cache),
+                "capacity": self.max_entries,
+                "in_flight": len(self._flights),
+                "hits": self._hits,
+                "coalesced": self._coalesced,
+                "misses": self._misses
+            }
+
+    def _store(self, key, result):
+        # Caller holds the lock
+        self._cache[key] = (time.monotonic() + self.ttl, result)
+        self._cache.move_to_end(key)
+
+        # Expired entries sit at the front (same TTL for all), then trim to size
+        now = time.monotonic()
+        while self._cache:
+            oldest_key, (expires_at, _) = next(iter(self._cache.items()))
+            if expires_at > now and len(self._cache) <= self.max_entries:
+                break
+            del self._cache[oldest_key]
@@ -0,0 +1,85 @@
+import argparse
+import io
+import os
+import sys
+
+from waitress import serve
+
+import migrations
+import server
+
+# =============================================================================
+# PRODUCTION ENTRY POINT
+# =============================================================================
+# Serves the Flask app with waitress (a multi-threaded WSGI server that also
+# runs on Windows) instead of the single-threaded development server.
+#
+#   python serve.py --threads 16 --pool-size 20
+#
+# Startup is health-gated: the server only starts listening once MySQL answers,
+# every pooled connection is open and the roster is loaded.
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cafeteria backend (production)")
+    parser.add_argument("--host", default=os.environ.get("CAFETERIA_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env_int("CAFETERIA_PORT", 5000))
+    parser.add_argument("--threads", type=int, default=env_int("CAFETERIA_THREADS", 8),
+                        help="request threads (one per concurrently served scan)")
+    parser.add_argument("--pool-size", type=int, default=env_int("CAFETERIA_DB_POOL_SIZE", server.DB_POOL_SIZE),
+                        help="MySQL pool size (max 32)")
+    parser.add_argument("--startup-timeout", type=int, default=env_int("CAFETERIA_STARTUP_TIMEOUT", 120),
+                        help="seconds to wait for MySQL before giving up")
+    parser.add_argument("--migrate", action="store_true",
+                        help="apply pending schema migrations before serving")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Set UTF-8 encoding for Windows console
+    if sys.platform == "win32":
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+        server.log_pipeline.set_console_stream(sys.stdout)
+
+    server.app.config["JSON_AS_ASCII"] = False
+    server.DB_POOL_SIZE = min(args.pool_size, 32)
+
+    print("\n" + "="*60)
+    print("🚀 CAFETERIA BACKEND SERVER (production)")
+    print("="*60)
+    print(f"📍 Backend API: http://{args.host}:{args.port}")
+    print(f"🧵 Threads: {args.threads} - DB pool: {server.DB_POOL_SIZE}")
+    print(f"🔗 Printer Server: {server.PRINTER_SERVER_URL}")
+    print("="*60 + "\n")
+
+    # HEALTH GATE: do not listen until the database is reachable, or at least
+    # until the roster can be served from the local snapshot (degraded mode)
+    if server.wait_for_database(timeout=args.startup_timeout):
+        if args.migrate:
+            conn = server.get_db_connection()
+            try:
+                migrations.upgrade(conn)
+            finally:
+                conn.close()
+
+        # WARMUP: open pooled connections and load caches before taking traffic
+        server.warm_up()
+        print("✅ Ready for traffic")
+    elif server.roster.load_snapshot():
+        print("⚠️ Starting in DEGRADED MODE - claims are spooled until MySQL is back")
+    else:
+        sys.exit(1)
+
+    server.start_background_services()
+
+    serve(server.app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
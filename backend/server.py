@@ -1,15 +1,54 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 import mysql.connector
 from mysql.connector import pooling
 from flask_cors import CORS
 import requests
-from datetime import datetime, time
+import io
+import os
+from datetime import date, datetime, timedelta
 import threading
-from queue import Queue
+import logging
+import uuid
+from collections import deque
+from time import perf_counter
+from roster import StudentRoster
+from reservations import ClaimReservations
+from claim_writer import ClaimWriteBehind
+from lanes import WorkerLane, CircuitBreaker, LaneFull, OPEN
+from escpos import PrinterPool, PrinterUnavailable, render_ticket
+from snapshot import RosterSnapshot
+from metrics import Metrics
+from scan_cache import ScanCoalescer
+from roster_import import RosterImportError, affected_codes, import_roster, read_roster_csv
+from reports import (
+    ReportRangeError, claim_summary, existing_claim_uids, parse_dimensions, parse_range,
+    stream_claims_csv, update_rollups
+)
+from rules import RULES_PATH, RuleEngine
+from log_pipeline import NOISE, setup_logging, begin_request, end_request, log_context, use_log_context
 
 app = Flask(__name__)
 CORS(app)
 
+# Logging goes through a queue drained by one background thread; success-path
+# lines (extra=NOISE) are kept for LOG_SAMPLE_RATE of requests only
+LOG_LEVEL = os.environ.get("CAFETERIA_LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("CAFETERIA_LOG_SAMPLE_RATE", 0.2))
+LOG_BUFFER_EVENTS = 2000        # Recent events kept for GET /logs
+LOG_JSON = os.environ.get("CAFETERIA_LOG_FORMAT", "text") == "json"
+
+log_pipeline = setup_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_BUFFER_EVENTS, LOG_JSON)
+logger = logging.getLogger("cafeteria")
+
+# Per-stage latency histograms, exposed on GET /metrics
+metrics = Metrics()
+
+# Local state (journal, reservations, snapshot) lives here
+RUNTIME_DIR = os.environ.get(
+    "CAFETERIA_RUNTIME_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime")
+)
+
 # =============================================================================
 # DATABASE CONFIGURATION
 # =============================================================================
@@ -19,94 +58,223 @@ db_config = {
     'password': 'root123',
     'database': 'cafeteria',
     'port': 3306,
-    'charset': 'utf8mb4'
+    'charset': 'utf8mb4',
+    'connection_timeout': 3     # Fail fast when MySQL is down
 }
 
-# Create connection pool for better performance
-db_pool = pooling.MySQLConnectionPool(
-    pool_name="cafeteria_pool",
-    pool_size=10,
-    pool_reset_session=True,
-    **db_config
+# Connection pool for better performance. Created on first use so the module
+# imports (and the server can health-gate startup) while MySQL is down.
+DB_POOL_SIZE = 10               # mysql-connector allows at most 32
+
+db_pool = None
+db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """Create the connection pool on first use"""
+    global db_pool
+    if db_pool is None:
+        with db_pool_lock:
+            if db_pool is None:
+                db_pool = pooling.MySQLConnectionPool(
+                    pool_name="cafeteria_pool",
+                    pool_size=DB_POOL_SIZE,
+                    pool_reset_session=True,
+                    **db_config
+                )
+    return db_pool
+
+
+# After repeated connection failures stop trying for a while, so a database
+# outage fails in microseconds instead of one connect timeout per caller
+DB_FAILURE_THRESHOLD = 3
+DB_RESET_SECONDS = 10
+
+db_breaker = CircuitBreaker("database", DB_FAILURE_THRESHOLD, DB_RESET_SECONDS)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of connecting while the database circuit is open"""
+
+
+def get_db_connection():
+    """Get a connection from the pool"""
+    if not db_breaker.allow():
+        raise DatabaseUnavailable("database circuit is open")
+    try:
+        with metrics.time_stage("pool_checkout"):
+            conn = get_db_pool().get_connection()
+    except mysql.connector.errors.PoolError:
+        # Pool exhausted: busy, not down
+        db_breaker.record_success()
+        raise
+    except mysql.connector.Error:
+        db_breaker.record_failure()
+        raise
+    db_breaker.record_success()
+    return conn
+
+# =============================================================================
+# IN-MEMORY ROSTER
+# =============================================================================
+# Students and today's claims are served from memory; MySQL is only read by
+# the roster's background refresher. Each refresh also rewrites a local SQLite
+# snapshot, used in degraded mode when MySQL cannot be reached.
+ROSTER_REFRESH_SECONDS = 300
+ROSTER_DEGRADED_RETRY_SECONDS = 10
+ROSTER_SNAPSHOT_PATH = os.path.join(RUNTIME_DIR, "roster_snapshot.sqlite3")
+
+roster = StudentRoster(
+    get_db_connection,
+    refresh_interval=ROSTER_REFRESH_SECONDS,
+    snapshot=RosterSnapshot(ROSTER_SNAPSHOT_PATH),
+    degraded_retry_interval=ROSTER_DEGRADED_RETRY_SECONDS,
+    database_down=lambda: db_breaker.state != "CLOSED"
 )
 
 # =============================================================================
-# BACKGROUND TASK QUEUE
+# CLAIM RESERVATIONS
 # =============================================================================
-# Queue for async printer and database operations
-task_queue = Queue()
+# Marker files let several server processes on this machine share reservations
+CLAIM_RESERVATION_DIR = os.path.join(RUNTIME_DIR, "reservations")
 
-def background_worker():
-    """Processes print jobs and database writes in background"""
-    while True:
-        task = task_queue.get()
-        if task is None:
-            break
-        try:
-            student_data = task['student']
-            service_type = task['service']
+claims = ClaimReservations(CLAIM_RESERVATION_DIR)
 
-            # Send to printer
-            send_to_printer(student_data, service_type)
+# =============================================================================
+# PRINT LANE
+# =============================================================================
+# Print jobs run on their own bounded lane; claim records go through the
+# write-behind below, so an unreachable printer never delays database writes.
+PRINT_WORKERS = 2
+PRINT_QUEUE_MAX = 200
+PRINT_MAX_ATTEMPTS = 5
 
-            # Save to database
-            conn = db_pool.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            save_claim_record(cursor, conn, student_data, service_type)
-            cursor.close()
-            conn.close()
+# Circuit breaker: after repeated failures stop calling the printer server and
+# park tickets until it comes back
+PRINTER_FAILURE_THRESHOLD = 3
+PRINTER_RESET_SECONDS = 15
+PRINTER_RETRY_SECONDS = 5
 
-        except Exception as e:
-            print(f"❌ Background task error: {e}")
-        finally:
-            task_queue.task_done()
+printer_breaker = CircuitBreaker("printer", PRINTER_FAILURE_THRESHOLD, PRINTER_RESET_SECONDS)
+# Not bounded: each parked ticket belongs to a claim the student was already
+# told about and cannot rescan for (at most one per student and service a day).
+# The print lane stays bounded; this only holds tickets it could not take.
+parked_tickets = deque()
+
+
+def print_ticket(task):
+    """Print lane handler: send one ticket unless the printer circuit is open"""
+    if not printer_breaker.allow():
+        parked_tickets.append(task)
+        return
+
+    # Log under the correlation id of the scan that queued the ticket
+    with use_log_context(task.get('log_context')):
+        with metrics.time_stage("printer"):
+            printed = send_to_printer(task['student'], task['service'])
+        metrics.increment("tickets_total", (("result", "printed" if printed else "failed"),))
+
+        if printed:
+            printer_breaker.record_success()
+            return
+
+        printer_breaker.record_failure()
+        task['attempts'] = task.get('attempts', 0) + 1
+        if task['attempts'] < PRINT_MAX_ATTEMPTS:
+            parked_tickets.append(task)
+        else:
+            logger.error(f"❌ Giving up on ticket for {task['student']['nombre']} after {task['attempts']} attempts")
 
-# Start background worker thread
-worker_thread = threading.Thread(target=background_worker, daemon=True)
-worker_thread.start()
+
+def retry_parked_tickets():
+    """Move parked tickets back onto the print lane once the printer may be up"""
+    wakeup = threading.Event()
+    while True:
+        wakeup.wait(PRINTER_RETRY_SECONDS)
+        if not parked_tickets or printer_breaker.state == OPEN:
+            continue
+
+        logger.info(f"🔁 Retrying {len(parked_tickets)} parked tickets")
+        while parked_tickets and not print_lane.saturated:
+            task = parked_tickets.popleft()
+            try:
+                print_lane.submit(task)
+            except LaneFull:
+                parked_tickets.appendleft(task)
+                break
+
+
+print_lane = WorkerLane("print", print_ticket, workers=PRINT_WORKERS, max_depth=PRINT_QUEUE_MAX)
 
 # =============================================================================
 # BUSINESS RULES
 # =============================================================================
-BLOCKED_HOMEROOMS = ["K2", "K3", "K4", "K5", "1", "2"]
 PRINTER_SERVER_URL = "http://localhost:3000/imprimir"
 
-# Schedule definitions
-SNACK_START = time(6, 0)      # 6:00 AM
-SNACK_END = time(11, 20)      # 11:20 AM
-LUNCH_START = time(11, 20)    # 11:20 AM
-LUNCH_END = time(18, 0)       # 6:00 PM
+# Direct printing: tickets are rendered here and sent to raw-socket (port 9100)
+# printers, e.g. CAFETERIA_PRINTERS="10.0.0.21,10.0.0.22:9100". When no printer
+# is configured tickets go through the Node.js printer server instead.
+PRINTER_ENDPOINTS = [endpoint for endpoint in os.environ.get("CAFETERIA_PRINTERS", "").split(",") if endpoint.strip()]
+PRINTER_STRATEGY = os.environ.get("CAFETERIA_PRINTER_STRATEGY", PrinterPool.ROUND_ROBIN)  # or least_busy
+PRINTER_SOCKET_TIMEOUT = 3
+
+printer_pool = (
+    PrinterPool.from_config(PRINTER_ENDPOINTS, strategy=PRINTER_STRATEGY, timeout=PRINTER_SOCKET_TIMEOUT)
+    if PRINTER_ENDPOINTS else None
+)
+
+# Service hours, holidays, half days, per-grade windows, blocked homerooms and
+# plan eligibility live in rules.json (reloaded automatically when edited)
+RULES_PATH = os.environ.get("CAFETERIA_RULES", RULES_PATH)
+RULES_CHECK_SECONDS = 5
+
+service_rules = RuleEngine(RULES_PATH, check_interval=RULES_CHECK_SECONDS)
 
 # =============================================================================
 # HELPER FUNCTIONS
 # =============================================================================
 
-def get_current_service():
-    """Determine which food service is currently available"""
-    now = datetime.now().time()
+def get_current_service(at=None):
+    """Determine which food service is available now (or at a given datetime)"""
+    return service_rules.rules.service_at(at or datetime.now())
 
-    if SNACK_START <= now < SNACK_END:
-        return "SNACK"
-    elif LUNCH_START <= now < LUNCH_END:
-        return "LUNCH"
-    else:
+
+def normalize_code(codigo):
+    """Scanned code as stored in the roster (MySQL used to ignore trailing spaces)"""
+    if codigo is None:
         return None
+    return str(codigo).strip()
+
+
+def is_code(value):
+    """Codes arrive as strings or plain numbers (never booleans, lists or objects)"""
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def resolve_student_service(lookup, codigo, at):
+    """(estudiante, service open for the student's grade); lookup(codigo, service) -> estudiante"""
+    rules = service_rules.rules
+    general = rules.service_at(at)
+    estudiante = lookup(codigo, general)
+    if not estudiante:
+        return None, general
+    service = rules.service_for(estudiante['grado'], at)
+    if service and service != general:
+        # This grade's schedule differs here: redo the duplicate check for its service
+        estudiante = lookup(codigo, service)
+    return estudiante, service
 
 
 def is_eligible_for_service(food_type, current_service):
     """Check if student's food type is eligible for current service"""
-    food_type_upper = food_type.upper()
-
-    if current_service == "SNACK":
-        return "REFRIGERIO" in food_type_upper
-    elif current_service == "LUNCH":
-        return "ALMUERZO" in food_type_upper
-    else:
-        return False
+    return service_rules.rules.is_eligible(food_type, current_service)
 
 
 def send_to_printer(student_data, service_type):
-    """Send ticket data to Node.js printer server"""
+    """Send ticket to the network printers, or to the Node.js printer server"""
+    if printer_pool:
+        return send_to_printer_pool(student_data, service_type)
+
     try:
         payload = {
             "contenido": {
@@ -117,217 +285,877 @@ def send_to_printer(student_data, service_type):
             }
         }
 
-        print(f"📤 Sending to printer: {student_data['nombre']} - {service_type}")
+        logger.info(f"📤 Sending to printer: {student_data['nombre']} - {service_type}", extra=NOISE)
 
         response = requests.post(PRINTER_SERVER_URL, json=payload, timeout=5)
 
         if response.status_code == 200:
-            print("✅ Ticket sent successfully")
+            logger.info("✅ Ticket sent successfully", extra=NOISE)
             return True
         else:
-            print(f"❌ Printer error: {response.text}")
+            logger.error(f"❌ Printer error: {response.text}")
             return False
 
     except requests.exceptions.RequestException as e:
-        print(f"❌ Connection error with printer server: {e}")
+        logger.error(f"❌ Connection error with printer server: {e}")
         return False
 
 
-def save_claim_record(cursor, conn, student_data, service_type):
-    """Save the food claim record to database"""
+def send_to_printer_pool(student_data, service_type):
+    """Render the ESC/POS ticket here and send it straight to a printer"""
     try:
-        sql = """
-            INSERT INTO registros_validacion
-                (codigo_estudiante, nombre, tipo_alimentacion, fecha_hora, plan, estado)
-            VALUES (%s, %s, %s, NOW(), %s, %s)
-        """
-        cursor.execute(sql, (
-            student_data['codigo_estudiante'],
-            student_data['nombre'],
-            student_data['tipo_alimentacion'],
-            service_type,
-            'VALIDADO'
-        ))
-        conn.commit()
-        print("✅ Claim record saved to database")
+        ticket = render_ticket(student_data['nombre'], service_type)
+        printer = printer_pool.send(ticket)
+        logger.info(f"✅ Ticket printed on {printer}: {student_data['nombre']} - {service_type}", extra=NOISE)
         return True
 
-    except mysql.connector.Error as err:
-        conn.rollback()
-        print(f"❌ Database error: {err}")
+    except PrinterUnavailable as e:
+        logger.error(f"❌ No printer available: {e}")
         return False
 
 
+def save_claim_records(cursor, conn, records):
+    """Save a batch of food claim records with one multi-row INSERT and one COMMIT"""
+    # IGNORE + unique claim_uid: replaying the journal never duplicates a record
+    record_sql = """
+        INSERT IGNORE INTO registros_validacion
+            (codigo_estudiante, nombre, tipo_alimentacion, fecha_hora, plan, estado, claim_uid)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+    daily_sql = """
+        INSERT IGNORE INTO reclamos_diarios
+            (codigo_estudiante, fecha, plan, fecha_hora)
+        VALUES (%s, %s, %s, %s)
+    """
+    start = perf_counter()
+    try:
+        # Only claims not yet in the table count towards the rollups, so a
+        # journal replay of an already committed batch adds nothing
+        already_saved = existing_claim_uids(cursor, [record['claim_uid'] for record in records])
+
+        # executemany() sends simple INSERTs as a single multi-row statement
+        cursor.executemany(record_sql, [
+            (
+                record['codigo_estudiante'],
+                record['nombre'],
+                record['tipo_alimentacion'],
+                record['fecha_hora'],
+                record['plan'],
+                'VALIDADO',
+                record['claim_uid']
+            )
+            for record in records
+        ])
+        cursor.executemany(daily_sql, [
+            (record['codigo_estudiante'], record['day'], record['plan'], record['fecha_hora'])
+            for record in records
+        ])
+        update_rollups(cursor, [record for record in records if record['claim_uid'] not in already_saved])
+        conn.commit()
+
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+
+    metrics.observe("claim_commit", perf_counter() - start)
+    metrics.increment("claims_persisted_total", amount=len(records))
+    logger.info(f"✅ {len(records)} claim records saved to database", extra=NOISE)
+
+
 def get_student_with_claim_check(cursor, student_code, service_type):
     """Optimized: Get student data and check duplicate claim in single query"""
+    # Primary key lookup on reclamos_diarios: cost does not grow with history
     cursor.execute("""
         SELECT
             e.codigo_estudiante,
             e.nombre,
             e.grado,
             e.tipo_alimentacion,
-            COUNT(r.id) as claim_count
+            (d.codigo_estudiante IS NOT NULL) as claim_count
         FROM estudiantes e
-        LEFT JOIN registros_validacion r ON
-            e.codigo_estudiante = r.codigo_estudiante
-            AND r.plan = %s
-            AND DATE(r.fecha_hora) = CURDATE()
-        WHERE e.codigo_estudiante = %s
-        GROUP BY e.codigo_estudiante, e.nombre, e.grado, e.tipo_alimentacion
+        LEFT JOIN reclamos_diarios d ON
+            d.codigo_estudiante = e.codigo_estudiante
+            AND d.fecha = CURDATE()
+            AND d.plan = %s
+        WHERE e.codigo_estudiante = %s AND e.activo = 1
     """, (service_type, student_code))
 
     return cursor.fetchone()
 
+
+def get_students_with_claims(cursor, student_codes, days):
+    """Set-based version of get_student_with_claim_check for many codes and days"""
+    code_marks = ", ".join(["%s"] * len(student_codes))
+    day_marks = ", ".join(["%s"] * len(days))
+    cursor.execute(f"""
+        SELECT
+            e.codigo_estudiante,
+            e.nombre,
+            e.grado,
+            e.tipo_alimentacion,
+            d.fecha,
+            d.plan
+        FROM estudiantes e
+        LEFT JOIN reclamos_diarios d ON
+            d.codigo_estudiante = e.codigo_estudiante
+            AND d.fecha IN ({day_marks})
+        WHERE e.codigo_estudiante IN ({code_marks}) AND e.activo = 1
+    """, (*days, *student_codes))
+
+    # One row per (student, claim): fold into {code: student} and claimed keys
+    students = {}
+    claimed = set()
+    for row in cursor.fetchall():
+        code = row['codigo_estudiante']
+        students[code] = {
+            'codigo_estudiante': code,
+            'nombre': row['nombre'],
+            'grado': row['grado'],
+            'tipo_alimentacion': row['tipo_alimentacion']
+        }
+        if row['fecha'] is not None:
+            claimed.add((code, row['fecha'], row['plan']))
+    return students, claimed
+
+
+def student_result(estudiante, success, message, **extra):
+    """Response body for a verification outcome about a known student"""
+    return {
+        "codigo_estudiante": estudiante['codigo_estudiante'],
+        "nombre": estudiante['nombre'],
+        "grado": estudiante['grado'],
+        "tipo_alimentacion": estudiante['tipo_alimentacion'],
+        "success": success,
+        **extra,
+        "message": message
+    }
+
+
+def already_claimed(estudiante, current_service):
+    service_name = "snack" if current_service == "SNACK" else "lunch"
+    logger.info(f"⛔ Already claimed {current_service} today")
+    return student_result(estudiante, False, f"{estudiante['nombre']} already claimed {service_name} today"), 403
+
+
+def check_claim_rules(estudiante, current_service):
+    """Apply the validations in order; returns (body, status) on rejection, None if allowed"""
+    # VALIDATION 1: Student not found
+    if not estudiante:
+        logger.info("❌ Student not found")
+        return {
+            "error": "invalid_code",
+            "message": "Code not found. Please go to treasury."
+        }, 404
+
+    nombre = estudiante['nombre']
+    grado = estudiante['grado']
+    tipo_alimentacion = estudiante['tipo_alimentacion']
+
+    logger.info(f"✅ Student found: {nombre} - Grade: {grado} - Food: {tipo_alimentacion}", extra=NOISE)
+
+    # Same rule set for every check of this scan, even if rules.json is reloaded meanwhile
+    rules = service_rules.rules
+
+    # VALIDATION 2: Blocked homeroom
+    if rules.is_blocked(grado):
+        logger.info(f"🚫 Blocked homeroom: {grado}")
+        return student_result(estudiante, False, f"{nombre} homeroom is not suitable to get a ticket"), 403
+
+    # VALIDATION 3: No food service (NINGUNO)
+    if not tipo_alimentacion or tipo_alimentacion.upper() == "NINGUNO":
+        logger.info("⚠️ No food service assigned")
+        return student_result(estudiante, False, f"{nombre} doesn't have any food service, please go to treasury"), 403
+
+    # VALIDATION 4: Service hours for this student's grade (grade windows can differ)
+    if not current_service:
+        logger.info(f"⏰ No service open for grade {grado}")
+        return student_result(
+            estudiante, False,
+            f"{nombre} cannot take food service at this time (grade {grado} schedule)"
+        ), 403
+
+    # VALIDATION 5: Check if student is eligible for current service
+    if not rules.is_eligible(tipo_alimentacion, current_service):
+        service_name = "snack" if current_service == "SNACK" else "lunch"
+        logger.info(f"❌ Not eligible for {current_service}")
+        return student_result(
+            estudiante, False,
+            f"{nombre} only has {tipo_alimentacion}, not eligible to take service at this time ({service_name})"
+        ), 403
+
+    # VALIDATION 6: Check for duplicate claim (already retrieved from optimized query)
+    if estudiante['claim_count'] > 0:
+        return already_claimed(estudiante, current_service)
+
+    return None
+
+
+def build_claim(estudiante, current_service, claimed_at):
+    """Print task and claim record for a scan that passed every validation"""
+    student_data = {
+        'codigo_estudiante': estudiante['codigo_estudiante'],
+        'nombre': estudiante['nombre'],
+        'grado': estudiante['grado'],
+        'tipo_alimentacion': estudiante['tipo_alimentacion']
+    }
+    record = {
+        **student_data,
+        'claim_uid': uuid.uuid4().hex,
+        'plan': current_service,
+        'fecha_hora': claimed_at,
+        'day': claimed_at.date()
+    }
+    return {'student': student_data, 'service': current_service, 'log_context': log_context()}, record
+
+
+def queue_print_tasks(print_tasks):
+    """Hand tickets to the print lane (parked if the lane is full)"""
+    for print_task in print_tasks:
+        try:
+            print_lane.submit(print_task)
+        except LaneFull:
+            # The claim is already durable, the ticket is printed once the lane drains
+            parked_tickets.append(print_task)
+
+# =============================================================================
+# CLAIM WRITE-BEHIND
+# =============================================================================
+# Claims are journaled to disk before responding and group-committed to MySQL
+CLAIM_JOURNAL_PATH = os.path.join(RUNTIME_DIR, "claims.journal")
+CLAIM_BATCH_SIZE = 50           # Flush once this many claims are waiting...
+CLAIM_BATCH_MAX_DELAY = 0.25    # ...or once the oldest has waited this long (seconds)
+PERSIST_WORKERS = 2
+PERSIST_QUEUE_MAX = 2000        # New claims get a 503 beyond this (not while the database is down)
+
+
+def on_claims_persisted(records):
+    """Claims are durable: keep them claimed for the rest of the day"""
+    for record in records:
+        roster.mark_claimed(record['codigo_estudiante'], record['plan'], record['day'])
+        claims.confirm(record['codigo_estudiante'], record['plan'], record['day'])
+
+
+def on_claims_failed(records):
+    """Claims were rejected by the database: let the students scan again"""
+    for record in records:
+        claims.release(record['codigo_estudiante'], record['plan'], record['day'])
+
+
+claim_writer = ClaimWriteBehind(
+    get_db_connection,
+    save_claim_records,
+    CLAIM_JOURNAL_PATH,
+    batch_size=CLAIM_BATCH_SIZE,
+    max_delay=CLAIM_BATCH_MAX_DELAY,
+    workers=PERSIST_WORKERS,
+    max_pending=PERSIST_QUEUE_MAX,
+    spooling=lambda: db_breaker.state != "CLOSED",
+    on_persisted=on_claims_persisted,
+    on_failed=on_claims_failed
+)
+
+# =============================================================================
+# STARTUP
+# =============================================================================
+services_started = False
+services_lock = threading.Lock()
+
+
+def wait_for_database(timeout=60, interval=2):
+    """Block until MySQL answers, so we never take traffic we cannot serve"""
+    deadline = datetime.now().timestamp() + timeout
+    wakeup = threading.Event()
+    while True:
+        try:
+            # Straight to the pool: the circuit breaker would skip attempts
+            conn = get_db_pool().get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            conn.close()
+            db_breaker.record_success()
+            return True
+        except Exception as e:
+            if datetime.now().timestamp() >= deadline:
+                logger.error(f"❌ Database still unreachable after {timeout}s: {e}")
+                return False
+            logger.warning(f"⏳ Waiting for database: {e}")
+            wakeup.wait(interval)
+
+
+def warm_up():
+    """Open every pooled connection and load the roster before serving"""
+    connections = []
+    try:
+        for _ in range(DB_POOL_SIZE):
+            conn = get_db_connection()
+            conn.ping(reconnect=True)
+            connections.append(conn)
+    finally:
+        for conn in connections:
+            conn.close()
+    logger.info(f"🔥 Warmed {len(connections)} pooled connections")
+
+    roster.reload()
+
+
+def start_background_services():
+    """Start the roster refresher, lanes and write-behind (once per process)"""
+    global services_started
+    with services_lock:
+        if services_started:
+            return
+        services_started = True
+
+    roster.start()
+    service_rules.start()
+    claim_writer.start()
+    print_lane.start()
+
+    # Start parked ticket retry thread
+    retry_thread = threading.Thread(target=retry_parked_tickets, name="print-retry", daemon=True)
+    retry_thread.start()
+
 # =============================================================================
 # MAIN ENDPOINT: VERIFY STUDENT CODE
 # =============================================================================
+def outside_hours_response(at):
+    """Rejection body listing the day's service hours"""
+    windows = service_rules.rules.describe(at.date())["services"]
+    if not windows:
+        return {"error": "outside_hours", "message": "No food service available today"}
+    hours = ", ".join(f"{service} {window['start']}-{window['end']}" for service, window in windows.items())
+    return {
+        "error": "outside_hours",
+        "message": f"No food service available at this time (Service hours: {hours})"
+    }
+
+BUSY_RESPONSE = {
+    "error": "busy",
+    "message": "Too many tickets in progress. Please scan again in a moment."
+}
+
+
+# Repeated reads within this window get the first read's answer
+SCAN_CACHE_SECONDS = float(os.environ.get("CAFETERIA_SCAN_CACHE_SECONDS", 3))
+SCAN_CACHE_MAX_ENTRIES = 2048
+
+# Only settled outcomes are replayed; errors and 503s are evaluated again
+scan_coalescer = ScanCoalescer(
+    ttl=SCAN_CACHE_SECONDS,
+    max_entries=SCAN_CACHE_MAX_ENTRIES,
+    cacheable=lambda result: result[1] in (200, 403, 404)
+)
+
+
+def claimed_result(estudiante, current_service):
+    service_name = "snack" if current_service == "SNACK" else "lunch"
+    return student_result(
+        estudiante, True,
+        f"Ticket is being printed! {estudiante['nombre']} can claim {service_name}.",
+        service_claimed=current_service
+    )
+
+
 @app.route("/verificar", methods=["POST"])
 def verificar_codigo():
     data = request.get_json()
-    codigo = data.get("codigo")
+    codigo = normalize_code(data.get("codigo"))
 
-    print(f"\n📥 Code received: {codigo}")
+    logger.info(f"📥 Code received: {codigo}", extra=NOISE)
 
     if not codigo:
         return jsonify({"error": "No code provided"}), 400
 
-    conn = None
-    try:
-        # OPTIMIZATION: Get connection from pool (5ms vs 150ms)
-        conn = db_pool.get_connection()
-        cursor = conn.cursor(dictionary=True)
+    # VALIDATION 4: Check current service time (do this early to fail fast)
+    now = datetime.now()
+    if not get_current_service(now):
+        logger.info("⏰ Outside service hours")
+        return jsonify(outside_hours_response(now)), 403
+
+    # Grade windows can differ, so key on the service open for this student's grade
+    if roster.loaded:
+        current_service = service_rules.rules.service_for(roster.grade(codigo), now)
+    else:
+        current_service = get_current_service(now)
 
-        # VALIDATION 4: Check current service time (do this early to fail fast)
-        current_service = get_current_service()
+    # OPTIMIZATION: Repeated reads of the same code share one evaluation and
+    # get the same answer for a few seconds (no second "already claimed")
+    (body, status, headers), source = scan_coalescer.run(
+        (codigo, current_service, now.date()),
+        lambda: evaluate_scan(codigo, now)
+    )
+    if source != "evaluated":
+        logger.info(f"🔁 Repeated scan answered from {source}", extra=NOISE)
+        metrics.increment("repeated_scans_total", (("source", source),))
 
-        if not current_service:
-            print("⏰ Outside service hours")
-            return jsonify({
-                "error": "outside_hours",
-                "message": "No food service available at this time (Service hours: 6:00 AM - 6:00 PM)"
-            }), 403
+    return jsonify(body), status, headers
 
-        # OPTIMIZATION: Single optimized query (student lookup + duplicate check)
-        # Replaces 2 sequential queries with 1 combined query (saves ~100ms)
-        estudiante = get_student_with_claim_check(cursor, codigo, current_service)
 
-        # VALIDATION 1: Student not found
-        if not estudiante:
-            print("❌ Student not found")
+def evaluate_scan(codigo, now):
+    """Validate one scan and queue its claim; returns (body, status, headers)"""
+    claim_day = now.date()
+    conn = None
+    cursor = None
+    try:
+        if roster.loaded:
+            # OPTIMIZATION: Student lookup + duplicate check answered from memory
+            with metrics.time_stage("roster_lookup"):
+                estudiante, current_service = resolve_student_service(roster.lookup, codigo, now)
+        else:
+            # Roster still loading: single optimized query (student lookup + duplicate check)
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            with metrics.time_stage("claim_check_query"):
+                estudiante, current_service = resolve_student_service(
+                    lambda code, service: get_student_with_claim_check(cursor, code, service), codigo, now
+                )
             cursor.close()
             conn.close()
-            return jsonify({
-                "error": "invalid_code",
-                "message": "Code not found. Please go to treasury."
-            }), 404
+            conn = None
 
-        nombre = estudiante['nombre']
-        grado = estudiante['grado']
-        tipo_alimentacion = estudiante['tipo_alimentacion']
-        claim_count = estudiante['claim_count']
+        # VALIDATIONS 1-6, then atomically reserve the claim so a second scan
+        # arriving before the background INSERT lands is rejected too
+        with metrics.time_stage("rules"):
+            rejection = check_claim_rules(estudiante, current_service)
+            if rejection is None and not claims.reserve(estudiante['codigo_estudiante'], current_service, claim_day):
+                rejection = already_claimed(estudiante, current_service)
+        if rejection:
+            body, status = rejection
+            return body, status, {}
 
-        print(f"✅ Student found: {nombre} - Grade: {grado} - Food: {tipo_alimentacion}")
+        # ALL VALIDATIONS PASSED
+        logger.info(f"✅ All validations passed - Queuing ticket for {current_service}", extra=NOISE)
 
-        # VALIDATION 2: Blocked homeroom
-        if grado in BLOCKED_HOMEROOMS:
-            print(f"🚫 Blocked homeroom: {grado}")
-            cursor.close()
-            conn.close()
-            return jsonify({
-                "codigo_estudiante": estudiante['codigo_estudiante'],
-                "nombre": nombre,
-                "grado": grado,
-                "tipo_alimentacion": tipo_alimentacion,
-                "success": False,
-                "message": f"{nombre} homeroom is not suitable to get a ticket"
-            }), 403
-
-        # VALIDATION 3: No food service (NINGUNO)
-        if tipo_alimentacion.upper() == "NINGUNO" or not tipo_alimentacion:
-            print(f"⚠️ No food service assigned")
-            cursor.close()
-            conn.close()
-            return jsonify({
-                "codigo_estudiante": estudiante['codigo_estudiante'],
-                "nombre": nombre,
-                "grado": grado,
-                "tipo_alimentacion": tipo_alimentacion,
-                "success": False,
-                "message": f"{nombre} doesn't have any food service, please go to treasury"
-            }), 403
-
-        # VALIDATION 5: Check if student is eligible for current service
-        if not is_eligible_for_service(tipo_alimentacion, current_service):
-            service_name = "snack" if current_service == "SNACK" else "lunch"
-            print(f"❌ Not eligible for {current_service}")
-            cursor.close()
-            conn.close()
-            return jsonify({
-                "codigo_estudiante": estudiante['codigo_estudiante'],
-                "nombre": nombre,
-                "grado": grado,
-                "tipo_alimentacion": tipo_alimentacion,
-                "success": False,
-                "message": f"{nombre} only has {tipo_alimentacion}, not eligible to take service at this time ({service_name})"
-            }), 403
-
-        # VALIDATION 6: Check for duplicate claim (already retrieved from optimized query)
-        if claim_count > 0:
-            service_name = "snack" if current_service == "SNACK" else "lunch"
-            print(f"⛔ Already claimed {current_service} today")
-            cursor.close()
-            conn.close()
-            return jsonify({
-                "codigo_estudiante": estudiante['codigo_estudiante'],
-                "nombre": nombre,
-                "grado": grado,
-                "tipo_alimentacion": tipo_alimentacion,
-                "success": False,
-                "message": f"{nombre} already claimed {service_name} today"
-            }), 403
+        print_task, record = build_claim(estudiante, current_service, now)
 
-        # ALL VALIDATIONS PASSED
-        print(f"✅ All validations passed - Queuing ticket for {current_service}")
+        # Journal the claim before answering so a crash cannot lose it
+        enqueue_start = perf_counter()
+        try:
+            claim_writer.submit(record)
+        except LaneFull:
+            # BACKPRESSURE: persistence is falling behind, ask the scanner to retry
+            claims.release(estudiante['codigo_estudiante'], current_service, claim_day)
+            logger.warning("🐢 Persistence lane full - rejecting scan")
+            return BUSY_RESPONSE, 503, {"Retry-After": "1"}
+        except Exception:
+            claims.release(estudiante['codigo_estudiante'], current_service, claim_day)
+            raise
 
         # CRITICAL OPTIMIZATION: Queue background task instead of waiting
         # This reduces response time from ~3000ms to ~70-150ms
-        task_queue.put({
-            'student': {
-                'codigo_estudiante': estudiante['codigo_estudiante'],
-                'nombre': nombre,
-                'grado': grado,
-                'tipo_alimentacion': tipo_alimentacion
-            },
-            'service': current_service
-        })
-
-        # Close connection immediately
-        cursor.close()
-        conn.close()
+        queue_print_tasks([print_task])
+        metrics.observe("enqueue", perf_counter() - enqueue_start)
 
         # RESPOND IMMEDIATELY (don't wait for printer or database write)
-        service_name = "snack" if current_service == "SNACK" else "lunch"
-        return jsonify({
-            "codigo_estudiante": estudiante['codigo_estudiante'],
-            "nombre": nombre,
-            "grado": grado,
-            "tipo_alimentacion": tipo_alimentacion,
-            "success": True,
-            "service_claimed": current_service,
-            "message": f"Ticket is being printed! {nombre} can claim {service_name}."
-        }), 200
+        return claimed_result(estudiante, current_service), 200, {}
 
-    except Exception as e:
-        print(f"❌ Server error: {e}")
+    except Exception:
+        logger.exception("❌ Server error")
         if conn and conn.is_connected():
-            cursor.close()
+            if cursor:
+                cursor.close()
             conn.close()
+        return {
+            "error": "server_error",
+            "message": "Internal server error. Please try again."
+        }, 500, {}
+
+
+# =============================================================================
+# BATCH ENDPOINT: VERIFY MANY CODES (offline scanner sync, multi-lane bursts)
+# =============================================================================
+BATCH_MAX_CODES = 500
+SCAN_CLOCK_SKEW = timedelta(minutes=2)  # Scanner clocks may run this far ahead of ours
+
+
+def parse_scan_time(value, default):
+    """Scanner timestamp (ISO 8601) as a naive local datetime"""
+    if not value:
+        return default
+    scanned_at = datetime.fromisoformat(value)
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone().replace(tzinfo=None)
+    return scanned_at
+
+
+def parse_batch_scans(data):
+    """[(codigo, scanned_at)] from {"codigos": [...]} or {"escaneos": [{codigo, fecha_hora}]}"""
+    now = datetime.now()
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    if "escaneos" in data:
+        scans = data["escaneos"]
+        if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+            raise ValueError("'escaneos' must be a list of objects")
+        scans = [(scan.get("codigo"), parse_scan_time(scan.get("fecha_hora"), now)) for scan in scans]
+    else:
+        codes = data.get("codigos", [])
+        if not isinstance(codes, list):
+            raise ValueError("'codigos' must be a list")
+        scans = [(codigo, now) for codigo in codes]
+    # Same normalization as /verificar; other values are rejected per scan
+    return [(normalize_code(codigo) if is_code(codigo) else codigo, scanned_at) for codigo, scanned_at in scans]
+
+
+@app.route("/verificar_lote", methods=["POST"])
+def verificar_lote():
+    data = request.get_json(silent=True) or {}
+    try:
+        scans = parse_batch_scans(data)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Invalid scan list"}), 400
+
+    logger.info(f"📥 Batch received: {len(scans)} codes")
+
+    if not scans:
+        return jsonify({"error": "No codes provided"}), 400
+    if len(scans) > BATCH_MAX_CODES:
+        return jsonify({"error": f"At most {BATCH_MAX_CODES} codes per batch"}), 413
+
+    try:
+        # A scan cannot be from the future: it would claim a service that has not started
+        latest = datetime.now() + SCAN_CLOCK_SKEW
+        valid = [(codigo, scanned_at) for codigo, scanned_at in scans if scanned_at <= latest]
+        days = sorted({scanned_at.date() for _, scanned_at in valid})
+        codes = sorted({codigo for codigo, _ in valid if codigo and isinstance(codigo, str)})
+
+        if roster.loaded and all(day == date.today() for day in days):
+            # OPTIMIZATION: Every scan is from today, answer from memory
+            def lookup(codigo, service, day):
+                return roster.lookup(codigo, service)
+        else:
+            # One set-based query resolves every student and claim in the batch
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor(dictionary=True)
+                students, claimed = get_students_with_claims(cursor, codes, days) if codes and days else ({}, set())
+                cursor.close()
+            finally:
+                conn.close()
+
+            def lookup(codigo, service, day):
+                student = students.get(codigo)
+                if student is None:
+                    return None
+                return {**student, 'claim_count': 1 if (codigo, day, service) in claimed else 0}
+
+        # Apply the same rules as /verificar, in submission order
+        results = []
+        accepted = []
+        for codigo, scanned_at in scans:
+            claim_day = scanned_at.date()
+
+            if codigo is None or codigo == "":
+                results.append({"codigo": codigo, "status": 400, "error": "No code provided"})
+                continue
+            if not isinstance(codigo, str):
+                results.append({"codigo": codigo, "status": 400, "error": "Invalid code"})
+                continue
+            if scanned_at > latest:
+                results.append({"codigo": codigo, "status": 400, "error": "Scan time is in the future"})
+                continue
+            if not get_current_service(scanned_at):
+                results.append({"codigo": codigo, "status": 403, **outside_hours_response(scanned_at)})
+                continue
+
+            estudiante, current_service = resolve_student_service(
+                lambda code, service: lookup(code, service, claim_day), codigo, scanned_at
+            )
+            rejection = check_claim_rules(estudiante, current_service)
+            if rejection is None and not claims.reserve(estudiante['codigo_estudiante'], current_service, claim_day):
+                rejection = already_claimed(estudiante, current_service)
+            if rejection:
+                body, status = rejection
+                results.append({"codigo": codigo, "status": status, **body})
+                continue
+
+            print_task, record = build_claim(estudiante, current_service, scanned_at)
+            accepted.append((print_task, record))
+            results.append({"codigo": codigo, "status": 200, **claimed_result(estudiante, current_service)})
+
+        # Queue every accepted claim with one journal write, then the tickets
+        records = [record for _, record in accepted]
+        try:
+            if records:
+                claim_writer.submit_many(records)
+        except LaneFull:
+            for record in records:
+                claims.release(record['codigo_estudiante'], record['plan'], record['day'])
+            logger.warning("🐢 Persistence lane full - rejecting batch")
+            return jsonify(BUSY_RESPONSE), 503, {"Retry-After": "1"}
+        except Exception:
+            for record in records:
+                claims.release(record['codigo_estudiante'], record['plan'], record['day'])
+            raise
+
+        queue_print_tasks([print_task for print_task, _ in accepted])
+
+        logger.info(f"✅ Batch done: {len(accepted)} of {len(scans)} codes claimed")
+        return jsonify({
+            "total": len(scans),
+            "claimed": len(accepted),
+            "results": results
+        }), 200
+
+    except Exception:
+        logger.exception("❌ Server error")
         return jsonify({
             "error": "server_error",
             "message": "Internal server error. Please try again."
         }), 500
 
 
+# =============================================================================
+# METRICS
+# =============================================================================
+@app.before_request
+def start_request_timer():
+    g.request_start = perf_counter()
+    # Correlation id: the scanner's X-Request-ID if it sends one
+    g.request_id = begin_request(request.headers.get("X-Request-ID"))
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None and request.endpoint:
+        metrics.observe(f"request:{request.endpoint}", perf_counter() - start)
+        metrics.increment("http_requests_total", (("endpoint", request.endpoint), ("status", response.status_code)))
+    if "request_id" in g:
+        response.headers["X-Request-ID"] = g.request_id
+    return response
+
+
+@app.teardown_request
+def clear_request_id(error=None):
+    end_request()
+
+
+def db_pool_in_use():
+    if db_pool is None:
+        return 0
+    # mysql-connector keeps idle connections in this queue
+    return db_pool.pool_size - db_pool._cnx_queue.qsize()
+
+
+metrics.gauge("print_lane_depth", lambda: print_lane.stats()["depth"], "Tickets waiting for the printer")
+metrics.gauge("print_lane_oldest_age_seconds", lambda: print_lane.stats()["oldest_age_seconds"])
+metrics.gauge("persistence_lane_depth", lambda: claim_writer.stats()["depth"], "Claims waiting for a group commit")
+metrics.gauge("persistence_lane_oldest_age_seconds", lambda: claim_writer.stats()["oldest_age_seconds"])
+metrics.gauge("unsynced_claims", lambda: claim_writer.stats()["unacknowledged"], "Journaled claims not yet in MySQL")
+metrics.gauge("parked_tickets", lambda: len(parked_tickets))
+metrics.gauge("db_pool_in_use", db_pool_in_use, "Pooled connections checked out")
+metrics.gauge("db_pool_size", lambda: DB_POOL_SIZE)
+metrics.gauge("printer_circuit_open", lambda: int(printer_breaker.state != "CLOSED"))
+metrics.gauge("database_circuit_open", lambda: int(db_breaker.state != "CLOSED"))
+metrics.gauge("roster_students", lambda: roster.stats()["students"])
+metrics.gauge("scan_cache_entries", lambda: scan_coalescer.stats()["entries"], "Recent scan results kept for repeated reads")
+metrics.gauge("log_events_dropped", lambda: log_pipeline.stats()["dropped"], "Log records dropped because the log queue was full")
+metrics.gauge("roster_degraded", lambda: int(roster.degraded))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (?format=json for p50/p95/p99 per stage in ms)"""
+    if request.args.get("format") == "json":
+        return jsonify(metrics.summary())
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# =============================================================================
+# HEALTH CHECK
+# =============================================================================
+@app.route("/health", methods=["GET"])
+def health():
+    """Ready for traffic once background services run and the roster is loaded"""
+    ready = services_started and roster.loaded
+    if not ready:
+        status = "starting"
+    elif roster.degraded:
+        # MySQL unreachable: roster from memory or the snapshot, claims wait in the journal
+        status = "degraded"
+    else:
+        status = "ready"
+    return jsonify({
+        "status": status,
+        "services_started": services_started,
+        "database_circuit": db_breaker.stats(),
+        "roster": roster.stats(),
+        "unsynced_claims": claim_writer.stats()["unacknowledged"]
+    }), 200 if ready else 503
+
+
+# =============================================================================
+# LANE MONITORING
+# =============================================================================
+@app.route("/lanes", methods=["GET"])
+def lanes_status():
+    """Depth and age of each background lane (to see when we fall behind)"""
+    return jsonify({
+        "print": print_lane.stats(),
+        "persistence": claim_writer.stats(),
+        "printer_circuit": printer_breaker.stats(),
+        "printers": printer_pool.stats() if printer_pool else {"server": PRINTER_SERVER_URL},
+        "parked_tickets": len(parked_tickets),
+        "scan_cache": scan_coalescer.stats()
+    })
+
+
+# =============================================================================
+# RECENT LOG EVENTS
+# =============================================================================
+@app.route("/logs", methods=["GET"])
+def recent_logs():
+    """Recent log events (?limit=200&level=WARNING&request_id=...)"""
+    limit = request.args.get("limit", 200, type=int)
+    events = log_pipeline.ring.recent(limit, request.args.get("level"), request.args.get("request_id"))
+    return jsonify({
+        "events": events,
+        "pipeline": log_pipeline.stats()
+    })
+
+
+# =============================================================================
+# REPORTS
+# =============================================================================
+@app.route("/reportes/resumen", methods=["GET"])
+def report_summary():
+    """Claims served (?desde=&hasta=YYYY-MM-DD&agrupar=fecha,plan,grado,tipo_alimentacion)"""
+    try:
+        first, last = parse_range(request.args.get("desde"), request.args.get("hasta"))
+        dimensions = parse_dimensions(request.args.get("agrupar"))
+    except ReportRangeError as e:
+        return jsonify({"error": "invalid_range", "message": str(e)}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        with metrics.time_stage("report_summary"):
+            rows = claim_summary(cursor, first, last, dimensions)
+        cursor.close()
+    except (mysql.connector.Error, DatabaseUnavailable) as e:
+        logger.error(f"❌ Report error: {e}")
+        return jsonify({"error": "database_error", "message": "Report unavailable"}), 503
+    finally:
+        if conn:
+            conn.close()
+
+    return jsonify({
+        "desde": first.isoformat(),
+        "hasta": last.isoformat(),
+        "agrupar": dimensions,
+        "total": sum(row['total'] for row in rows),
+        "filas": rows
+    })
+
+
+@app.route("/reportes/reclamos.csv", methods=["GET"])
+def report_claims_csv():
+    """Raw claim records for a date range, streamed as CSV (?desde=&hasta=)"""
+    try:
+        first, last = parse_range(request.args.get("desde"), request.args.get("hasta"))
+    except ReportRangeError as e:
+        return jsonify({"error": "invalid_range", "message": str(e)}), 400
+
+    # Own connection rather than a pooled one: a long download must not hold
+    # a connection the scanners need
+    try:
+        conn = mysql.connector.connect(**db_config)
+    except mysql.connector.Error as e:
+        logger.error(f"❌ Export error: {e}")
+        return jsonify({"error": "database_error", "message": "Export unavailable"}), 503
+
+    chunks = stream_claims_csv(conn, first, last)
+    filename = f"reclamos_{first.isoformat()}_{last.isoformat()}.csv"
+    return Response(chunks, mimetype="text/csv", headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    })
+
+
+# =============================================================================
+# ROSTER MAINTENANCE
+# =============================================================================
+@app.route("/roster/reload", methods=["POST"])
+def reload_roster():
+    """Force a roster reload after treasury edits (some students or everyone)"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    codigos = data.get("codigos") or ([data["codigo"]] if data.get("codigo") else [])
+    if not isinstance(codigos, list) or not all(is_code(codigo) for codigo in codigos):
+        return jsonify({"error": "'codigos' must be a list of codes"}), 400
+
+    # Same normalization as the scan endpoints; an empty list still reloads everyone
+    codigos = [normalize_code(codigo) for codigo in codigos]
+    if not all(codigos):
+        return jsonify({"error": "Empty code in 'codigos'"}), 400
+
+    refresh_students(codigos)
+    logger.info(f"🔄 Roster reload scheduled: {len(codigos) or 'all'} students")
+
+    return jsonify({
+        "status": "scheduled",
+        "codigos": codigos,
+        "roster": roster.stats()
+    }), 202
+
+
+ROSTER_IMPORT_FULL_RELOAD = 2000    # Past this many changed students reload everyone
+roster_import_lock = threading.Lock()
+
+
+def refresh_students(codes):
+    """Reload the given students (everyone if empty) and forget their recent scans"""
+    codes = set(codes)
+    if not codes or len(codes) > ROSTER_IMPORT_FULL_RELOAD:
+        roster.invalidate()
+        scan_coalescer.invalidate()
+    else:
+        roster.invalidate_students(codes)
+        scan_coalescer.invalidate(lambda key: key[0] in codes)
+
+
+@app.route("/roster/import", methods=["POST"])
+def import_roster_csv():
+    """Apply a treasury CSV roster (?dry_run=1, ?keep_missing=1 for a partial file)"""
+    upload = request.files.get("file")
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+    dry_run = request.args.get("dry_run") in ("1", "true")
+    keep_missing = request.args.get("keep_missing") in ("1", "true")
+
+    # One import at a time; a second one would diff against stale rows
+    if not roster_import_lock.acquire(blocking=False):
+        return jsonify({"error": "import_running", "message": "Another roster import is running"}), 409
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with metrics.time_stage("roster_import"):
+            report = import_roster(conn, read_roster_csv(stream), deactivate_missing=not keep_missing, dry_run=dry_run)
+    except (RosterImportError, UnicodeDecodeError) as e:
+        return jsonify({"error": "invalid_roster", "message": str(e)}), 400
+    except (mysql.connector.Error, DatabaseUnavailable) as e:
+        logger.error(f"❌ Roster import failed: {e}")
+        return jsonify({"error": "database_error", "message": "Roster import failed, nothing was changed"}), 503
+    finally:
+        if conn:
+            conn.close()
+        roster_import_lock.release()
+
+    if not dry_run:
+        codes = affected_codes(report)
+        if codes:
+            refresh_students(codes)
+        logger.info(f"📥 Roster imported: {report['counts']}")
+
+    return jsonify(report), 200
+
+
 # =============================================================================
 # TEST ENDPOINTS
 # =============================================================================
@@ -335,7 +1163,7 @@ def verificar_codigo():
 def test_db():
     """Test database connection (optimized with connection pool)"""
     try:
-        conn = db_pool.get_connection()
+        conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT codigo_estudiante, nombre FROM estudiantes LIMIT 5")
         datos = cursor.fetchall()
@@ -343,7 +1171,7 @@ def test_db():
         conn.close()
         return jsonify(datos)
     except Exception as e:
-        print(f"❌ Database error: {e}")
+        logger.error(f"❌ Database error: {e}")
         return jsonify({"error": "Database connection failed"}), 500
 
 
@@ -366,17 +1194,32 @@ def test_nodejs():
 
 @app.route("/current_service", methods=["GET"])
 def current_service():
-    """Get current service time (for testing)"""
-    service = get_current_service()
-    now = datetime.now()
+    """Get current service time (?at=2026-11-27T12:45 to simulate a moment, ?grado=3 for one grade)"""
+    try:
+        now = parse_scan_time(request.args.get("at"), datetime.now())
+    except ValueError:
+        return jsonify({"error": "Invalid 'at' datetime"}), 400
+
+    grado = request.args.get("grado")
+    service = service_rules.rules.service_for(grado, now) if grado else get_current_service(now)
     return jsonify({
         "current_time": now.strftime("%I:%M %p"),
         "current_service": service,
-        "snack_hours": "6:00 AM - 11:20 AM",
-        "lunch_hours": "11:20 AM - 6:00 PM"
+        "calendar": service_rules.rules.describe(now.date()),
+        "rules": service_rules.stats()
     })
 
 
+@app.route("/rules/reload", methods=["POST"])
+def reload_rules():
+    """Re-read rules.json now instead of waiting for the file watcher"""
+    if not service_rules.reload():
+        return jsonify({"status": "error", "rules": service_rules.stats()}), 400
+    # Recent answers may have been decided under the old rules
+    scan_coalescer.invalidate()
+    return jsonify({"status": "reloaded", "rules": service_rules.stats()})
+
+
 # =============================================================================
 # START SERVER
 # =============================================================================
@@ -385,9 +1228,9 @@ if __name__ == "__main__":
 
     # Set UTF-8 encoding for Windows console
     import sys
-    import io
     if sys.platform == "win32":
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+        log_pipeline.set_console_stream(sys.stdout)
 
 
     print("\n" + "="*60)
@@ -395,8 +1238,14 @@ if __name__ == "__main__":
     print("="*60)
     print(f"📍 Backend API: http://localhost:5000")
     print(f"🔗 Printer Server: {PRINTER_SERVER_URL}")
-    print(f"🍎 Snack Hours: 6:00 AM - 11:20 AM")
-    print(f"🍽️  Lunch Hours: 11:20 AM - 6:00 PM")
-    print(f"🚫 Blocked Homerooms: {', '.join(BLOCKED_HOMEROOMS)}")
+    today = service_rules.rules.describe(date.today())
+    for service, window in today["services"].items():
+        print(f"🍽️  {service} Hours: {window['start']} - {window['end']}")
+    print(f"🚫 Blocked Homerooms: {', '.join(today['blocked_grades'])}")
     print("="*60 + "\n")
+
+    # Development server only (see serve.py for production). With the
+    # reloader only the child process (WERKZEUG_RUN_MAIN) serves requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+from datetime import date, datetime
+
+# =============================================================================
+# LOCAL ROSTER SNAPSHOT
+# =============================================================================
+# A SQLite copy of `estudiantes` and today's claims, rewritten after every
+# roster refresh. When MySQL is unreachable at startup the roster loads from
+# here so scanning keeps working; claims made meanwhile wait in the claim
+# journal and are replayed (deduplicated by claim_uid) once MySQL is back.
+
+
+class RosterSnapshot:
+    """Atomically replaced SQLite file holding the last known roster"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, students, claimed, day):
+        """Write a fresh snapshot next to the old one, then swap it in"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        temp_path = self.path + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        conn = sqlite3.connect(temp_path)
+        try:
+            conn.executescript("""
+                CREATE TABLE estudiantes (
+                    codigo_estudiante TEXT PRIMARY KEY,
+                    nombre TEXT NOT NULL,
+                    grado TEXT NOT NULL,
+                    tipo_alimentacion TEXT NOT NULL
+                );
+                CREATE TABLE reclamos (
+                    codigo_estudiante TEXT NOT NULL,
+                    plan TEXT NOT NULL,
+                    PRIMARY KEY (codigo_estudiante, plan)
+                );
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+            conn.executemany(
+                "INSERT INTO estudiantes VALUES (?, ?, ?, ?)",
+                [
+                    (s['codigo_estudiante'], s['nombre'], s['grado'], s['tipo_alimentacion'])
+                    for s in students.values()
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO reclamos VALUES (?, ?)",
+                [(code, plan) for plan, codes in claimed.items() for code in codes]
+            )
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("day", day.isoformat()),
+                ("taken_at", datetime.now().isoformat())
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(temp_path, self.path)
+
+    def load(self):
+        """(students, claimed, day, taken_at), or None if there is no snapshot"""
+        if not os.path.exists(self.path):
+            return None
+
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            students = {
+                row['codigo_estudiante']: dict(row)
+                for row in conn.execute("SELECT * FROM estudiantes")
+            }
+            claimed = {}
+            for row in conn.execute("SELECT codigo_estudiante, plan FROM reclamos"):
+                claimed.setdefault(row['plan'], set()).add(row['codigo_estudiante'])
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        finally:
+            conn.close()
+
+        return students, claimed, date.fromisoformat(meta["day"]), datetime.fromisoformat(meta["taken_at"])
@@ -0,0 +1,42 @@
+from datetime import date, datetime
+
+from rules import DEFAULT_RULES, RuleSet
+
+# A plain weekday with no holiday or half day
+MONDAY = date(2026, 10, 19)
+
+
+def rules_with(grade_windows):
+    return RuleSet({**DEFAULT_RULES, "grade_windows": grade_windows})
+
+
+def at(hour, minute):
+    return datetime(MONDAY.year, MONDAY.month, MONDAY.day, hour, minute)
+
+
+def test_grade_window_wins_over_a_later_general_window():
+    rules = rules_with({"3": {"SNACK": {"start": "06:00", "end": "12:00"}}})
+
+    assert rules.service_for("3", at(11, 45)) == "SNACK"
+    assert rules.service_for("3", at(12, 0)) == "LUNCH"
+    assert rules.service_for("9", at(11, 45)) == "LUNCH"
+    assert rules.describe(MONDAY)["grade_windows"]["3"]["SNACK"] == {"start": "06:00", "end": "12:00"}
+
+
+def test_grade_window_wins_over_an_earlier_general_window():
+    rules = rules_with({"3": {"LUNCH": {"start": "11:00", "end": "11:40"}}})
+
+    assert rules.service_for("3", at(11, 5)) == "LUNCH"
+    assert rules.service_for("3", at(11, 45)) is None
+    assert rules.service_for("9", at(11, 5)) == "SNACK"
+    # Open for someone, so the early outside-hours check lets the scan through
+    assert rules.service_at(at(11, 5)) == "SNACK"
+
+
+def test_grade_window_replaces_the_general_window_of_that_service():
+    rules = rules_with({"11": {"LUNCH": {"start": "12:30", "end": "14:00"}}})
+
+    assert rules.service_for("11", at(12, 0)) is None
+    assert rules.service_for("11", at(12, 30)) == "LUNCH"
+    assert rules.service_for("11", at(14, 0)) is None
+    assert rules.service_for("11", at(10, 0)) == "SNACK"